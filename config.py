@@ -22,6 +22,25 @@ STEP2_OUTPUT_FILENAME = 'raw_urls_list.csv'
 STEP3_OUTPUT_FILENAME = 'unique_urls_list.csv'
 GCS_BUCKET_NAME = os.environ.get('GCS_BUCKET_NAME', 'your-gcs-bucket-name') #STEP4
 SQLITE_DB_FILENAME = "scraped_data.sqlite" #STEP4
+# GCSへのアップロードを分割(resumable upload)する際のチャンクサイズ。GCSの仕様上、256KiBの倍数である必要がある。
+GCS_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+# GCSへ複数ファイルをまとめて保存(save_many)する際の並列アップロード数
+GCS_UPLOAD_MAX_WORKERS = int(os.environ.get('GCS_UPLOAD_MAX_WORKERS', '16'))
+# このサイズを超えるファイルは、XML multipart upload で GCS_MULTIPART_CHUNK_SIZE ごとのパートに分けて並列にアップロードする
+GCS_MULTIPART_THRESHOLD = int(os.environ.get('GCS_MULTIPART_THRESHOLD', str(150 * 1024 * 1024)))
+GCS_MULTIPART_CHUNK_SIZE = int(os.environ.get('GCS_MULTIPART_CHUNK_SIZE', str(150 * 1024 * 1024)))
+GCS_MULTIPART_MAX_WORKERS = int(os.environ.get('GCS_MULTIPART_MAX_WORKERS', '10'))
+# GCSに保存するオブジェクトに付ける Cache-Control (例: 'public, max-age=3600')。未設定なら付けない。
+# GCSのエッジキャッシュが効くのは、バケットが公開読み取り可能で、Requester Pays や CMEK を使っていない場合だけ。
+GCS_DEFAULT_CACHE_CONTROL = os.environ.get('GCS_DEFAULT_CACHE_CONTROL')
+# GCSからの読み込みで、GCS_DOWNLOAD_THRESHOLD を超えるファイルは GCS_DOWNLOAD_CHUNK_SIZE ごとのRange GETに分けて並列にダウンロードする
+# (read() ではサイズが事前に分からないので、まず先頭の GCS_DOWNLOAD_THRESHOLD + 1 バイトを1回のGETで取得し、それに収まらなかった場合だけ並列に切り替える)
+GCS_DOWNLOAD_THRESHOLD = int(os.environ.get('GCS_DOWNLOAD_THRESHOLD', str(8 * 1024 * 1024)))
+GCS_DOWNLOAD_CHUNK_SIZE = int(os.environ.get('GCS_DOWNLOAD_CHUNK_SIZE', str(8 * 1024 * 1024)))
+GCS_DOWNLOAD_MAX_WORKERS = int(os.environ.get('GCS_DOWNLOAD_MAX_WORKERS', '8'))
+# GCS上のページを順に読み出す(get_storage_iterator)際の並列ダウンロード数と、先読みして手元に置いておく最大件数
+GCS_ITERATOR_MAX_WORKERS = 16
+GCS_ITERATOR_PREFETCH = 32
 STEP5_OUTPUT_FILENAME = 'chunks.json'
 
 
@@ -53,6 +72,12 @@ EMBEDDING_BATCH_SIZE = 250
 # Vector Searchのupsert_datapointsメソッドの1リクエストあたりのデータポイント上限は1,000です
 VECTOR_SEARCH_UPSERT_BATCH_SIZE = 1000
 
+# --- Pipeline Settings (STEP7) ---
+# Embedding生成とVector Searchへのupsertを並行して走らせるためのスレッド数とキューの上限
+EMBEDDING_MAX_WORKERS = int(os.environ.get('EMBEDDING_MAX_WORKERS', '4'))
+VECTOR_SEARCH_UPSERT_MAX_WORKERS = int(os.environ.get('VECTOR_SEARCH_UPSERT_MAX_WORKERS', '2'))
+EMBEDDING_QUEUE_MAXSIZE = 16
+
 
 """APP_ENV="development"
 TIMEOUT=30
@@ -1,7 +1,22 @@
+from functools import lru_cache
+
+from sqlalchemy import create_engine
 from sqlalchemy.orm import declarative_base
 
+import config
+
 # Base オブジェクトは、それに紐づく全てのモデルクラスの情報を集約する「レジストリ」の役割を持っています。
 # 具体的には、内部の MetaData オブジェクトが、どのモデルがどのテーブルに対応するのか、
 # カラムやリレーションシップはどうなっているのか、といった全ての情報を保持します。
 # 基本、一つのアプリにつき一つだけインスタンス化して、アプリ内で共有する。
-Base = declarative_base()
\ No newline at end of file
+Base = declarative_base()
+
+
+# Engine はコネクションプールを内部に持つので、ステップごとに create_engine() し直すと、
+# 毎回新しいプールとDBへのTCP接続（ハンドシェイク）が発生してしまう。
+# lru_cache(maxsize=1) により最初の呼び出しで一度だけ作り、同一プロセス内の全ステップで使い回す。
+@lru_cache(maxsize=1)
+def get_engine():
+    """Returns the process-wide SQLAlchemy engine for DATABASE_URL."""
+    # pool_pre_ping=True で、プールから取り出した接続が切れていないかを使う前に確認する
+    return create_engine(config.DATABASE_URL, pool_pre_ping=True, pool_size=10)
@@ -5,6 +5,7 @@ from datetime import datetime
 import config
 import logging
 from config_logging import setup_logging
+from storage_strategies import close_all as close_all_storages
 
 from step1_extract_seed_urls.run import execute as step1
 from step2_crawl_all_urls.run import execute as step2
@@ -31,11 +32,15 @@ def main(run_id: str | None = None):
     logger.info(f"--- Starting execution with Run ID: {run_id} ---")
     logger.info(f"All outputs will be saved in: {interaction_dir}")
 
-    step1(interaction_dir)
-    step2(interaction_dir)
-    step3(interaction_dir)
-    step4(interaction_dir)
-    step5(interaction_dir)
+    try:
+        step1(interaction_dir)
+        step2(interaction_dir)
+        step3(interaction_dir)
+        step4(interaction_dir)
+        step5(interaction_dir)
+    finally:
+        # 各ステップで共有しているストレージ(SQLite接続など)をまとめて閉じる
+        close_all_storages()
 
 
 
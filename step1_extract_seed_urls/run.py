@@ -6,7 +6,6 @@ from playwright.sync_api import sync_playwright, Playwright, Error
 
 import config
 from storage_strategies import get_storage_strategy
-from utils import convert_rows_to_in_memory_csv
 
 import logging
 from config_logging import setup_logging
@@ -136,17 +135,15 @@ def execute(
         logger.info(f"Successfully extracted a total of {len(urls)} URLs.")
 
 
-        # Step 3: Write URLs to an in-memory virtual CSV
+        # Step 3: Prepare URLs as CSV rows
         logger.info("Preparing extracted URLs for CSV conversion...")
         # データ形式を List[str] から List[List[str]] に変換する
         rows_to_write = [[url] for url in urls]
-        logger.info("Converting extracted URLs to in-memory CSV buffer...")
-        string_io = convert_rows_to_in_memory_csv(rows_to_write)
-        logger.info("In-memory CSV buffer created successfully.")
 
         # Step 4: Use the selected strategy to save the file
+        # save_rowsは、ストレージに応じてCSVをファイルへ直接書き出す(またはメモリ上で組み立ててから保存する)
         logger.info(f"Attempting to save URLs to '{STEP1_OUTPUT_FILENAME}' in directory '{interaction_dir}'...")
-        storage_saver.save(string_io, STEP1_OUTPUT_FILENAME)
+        storage_saver.save_rows(rows_to_write, STEP1_OUTPUT_FILENAME)
         logger.info(f"Successfully saved URLs to '{STEP1_OUTPUT_FILENAME}' in directory '{interaction_dir}'.")
 
     except Exception as e: # まず全てのエラーをここで捕捉する
@@ -1,6 +1,7 @@
 import sys
 import os
 import csv
+import io
 import time
 import random
 from urllib.parse import urljoin, urlparse
@@ -8,7 +9,6 @@ from playwright.sync_api import sync_playwright, Error, Locator, BrowserContext,
 
 import config
 from storage_strategies import get_storage_strategy
-from utils import convert_rows_to_in_memory_csv
 
 import logging
 from config_logging import setup_logging
@@ -203,9 +203,11 @@ def execute(interaction_dir) -> None:
 
     try:
         logger.info(f"Loading seed URLs from '{STEP1_OUTPUT_FILENAME}'...")
-        string_io = storage.read(STEP1_OUTPUT_FILENAME)
-        reader = csv.reader(string_io)
-        seed_urls = [row[0] for row in reader if row]
+        # ファイル全体を文字列にせず、バイトのストリームを TextIOWrapper で少しずつデコードしながら csv.reader に渡す
+        # (newline='' で改行の変換をさせないのは、csvモジュールの要求どおり)
+        with storage.read_stream(STEP1_OUTPUT_FILENAME) as stream:
+            reader = csv.reader(io.TextIOWrapper(stream, encoding='utf-8', newline=''))
+            seed_urls = [row[0] for row in reader if row]
         if not seed_urls:
             logger.critical("No seed URLs found. Aborting.")
             return
@@ -240,12 +242,8 @@ def execute(interaction_dir) -> None:
         # データ形式を List[Dict] から List[List[str]] に変換する
         rows_to_write = [[title, url] for article in all_articles for title, url in article.items()]
 
-        logger.info("Converting articles to in-memory CSV buffer...")
-        output_io = convert_rows_to_in_memory_csv(rows_to_write)
-        logger.debug("In-memory CSV buffer created successfully.")
-
         logger.info(f"Saving articles to '{STEP2_OUTPUT_FILENAME}'...")
-        storage.save(output_io, STEP2_OUTPUT_FILENAME)
+        storage.save_rows(rows_to_write, STEP2_OUTPUT_FILENAME)
         logger.info(f"Successfully saved {len(all_articles)} articles.")
 
     except FileNotFoundError:
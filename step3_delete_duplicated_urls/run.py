@@ -1,10 +1,10 @@
 import sys
 import os
 import csv
+import io
 import config
 
 from storage_strategies import get_storage_strategy, StorageFileNotFoundError, StoragePermissionError
-from utils import convert_rows_to_in_memory_csv
 
 import logging
 from config_logging import setup_logging
@@ -47,20 +47,16 @@ def execute(interaction_dir):
         logger.info(f"Loading URLs from '{STEP2_FILENAME}'...")
         # LocalStorageを使っている場合には、csvからioに読み込み、再度csvに戻すという無駄が発生しているが、
         # これは、GCS Storageを使った時との統一的な扱い、抽象化するための無駄。
-        string_io_input = storage.read(STEP2_FILENAME)
-        reader = csv.reader(string_io_input)
-        rows = list(reader)
+        # ファイル全体を一つの文字列にせず、ストリームから少しずつデコードしながら読み込む
+        with storage.read_stream(STEP2_FILENAME) as stream:
+            rows = list(csv.reader(io.TextIOWrapper(stream, encoding='utf-8', newline='')))
         logger.info(f"Successfully loaded {len(rows)} rows.")
 
         processed_rows = _remove_duplicate_rows_by_url(rows)
         logger.info(f"Successfully processed {len(processed_rows)} unique rows.")
 
-        logger.info(f"Converting {len(processed_rows)} unique rows to in-memory CSV...")
-        string_io_output = convert_rows_to_in_memory_csv(processed_rows)
-        logger.debug("In-memory CSV buffer created successfully.")
-
         logger.info(f"Saving unique rows to '{STEP3_FILENAME}'...")
-        storage.save(string_io_output, STEP3_FILENAME)
+        storage.save_rows(processed_rows, STEP3_FILENAME)
         logger.info(f"Successfully saved {len(processed_rows)} rows to '{STEP3_FILENAME}'.")
 
     except Exception as e:
@@ -1,14 +1,15 @@
 import sys
 import os
-import io
 import csv
+import io
 import time
 import random
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, Future
 from playwright.sync_api import sync_playwright, Error, Playwright, Browser, expect
 
 import config
-from storage_strategies import get_storage_strategy, StorageFileNotFoundError
+from storage_strategies import get_storage_strategy, StorageFileNotFoundError, StorageBatchError, PageMeta
 
 import logging
 from config_logging import setup_logging
@@ -21,6 +22,10 @@ TIMEOUT_MS = config.TIMEOUT * 1000
 USER_AGENTS = config.USER_AGENTS
 STEP3_FILENAME = config.STEP3_OUTPUT_FILENAME
 
+# --- Logic Constants ---
+# スクレイピング結果をこの件数ごとにまとめて保存する（SQLiteでは1トランザクション＝1回のcommitになる）
+SAVE_BATCH_SIZE = 500
+
 class RedirectedURLSkipException(Exception):
     """リダイレクトが検出され、URLの処理をスキップすることを示すための例外。"""
     pass
@@ -175,6 +180,34 @@ class Scraper:
             logger.debug(f"Page and context for {url} closed.")
 
 
+def _flush_pending_saves(output_storage, pending_saves: list[tuple[str, str, bytes, str]]) -> list[tuple[str, str]]:
+    """
+    Saves the pending pages in one batch via save_many().
+    Returns the (category, url) pairs that could not be saved so that they can be retried.
+    """
+    if not pending_saves:
+        return []
+
+    try:
+        output_storage.save_many(
+            (html_bytes, safe_filename, PageMeta(category=category))
+            for category, _url, html_bytes, safe_filename in pending_saves
+        )
+        logger.info(f"Saved a batch of {len(pending_saves)} pages.")
+        return []
+    except StorageBatchError as e:
+        # 一部のページだけ失敗した場合は、失敗したページだけを再試行の対象にする
+        failed_filenames = {filename for filename, _error in e.failures}
+        logger.error(f"Failed to save {len(failed_filenames)} of {len(pending_saves)} pages in a batch: {e}")
+        return [
+            (category, url) for category, url, _html_bytes, safe_filename in pending_saves
+            if safe_filename in failed_filenames
+        ]
+    except Exception as e:
+        logger.error(f"Failed to save a batch of {len(pending_saves)} pages: {e}")
+        return [(category, url) for category, url, _html_bytes, _safe_filename in pending_saves]
+
+
 def execute(interaction_dir) -> None:
     """Main execution function for step 4."""
     logger.info("--- Step 4: Starting Scrape and Save HTML ---")
@@ -189,14 +222,14 @@ def execute(interaction_dir) -> None:
     try:
         # 1. URLリストとカテゴリの読み込み
         logger.info(f"Loading unique URLs from '{STEP3_FILENAME}'...")
-        string_io = input_storage.read(STEP3_FILENAME)
-        reader = csv.reader(string_io)
         urls_to_process = []
-        for row in reader:
-            if row and len(row) > 1:
-                urls_to_process.append((row[0], row[1])) # (category, url)
-            else:
-                logger.warning(f"Skipping malformed row in CSV: {row}")
+        # ファイル全体を一つの文字列にせず、ストリームから少しずつデコードしながら読み込む
+        with input_storage.read_stream(STEP3_FILENAME) as stream:
+            for row in csv.reader(io.TextIOWrapper(stream, encoding='utf-8', newline='')):
+                if row and len(row) > 1:
+                    urls_to_process.append((row[0], row[1])) # (category, url)
+                else:
+                    logger.warning(f"Skipping malformed row in CSV: {row}")
 
         if not urls_to_process:
             logger.critical("No valid URLs found. Aborting.")
@@ -206,7 +239,10 @@ def execute(interaction_dir) -> None:
         # 2. スクレイピングと保存のループ (リトライ機構付き)
         MAX_ATTEMPTS = 3  # 最初の試行 + 2回のリトライ
 
-        with Scraper(timeout_ms=TIMEOUT_MS, user_agents=USER_AGENTS) as scraper:
+        # 保存はバックグラウンドのスレッド1本で行い、バッチを保存している間もスクレイピングを続けられるようにする。
+        # ワーカーを1本にしているので、保存の順序はバッチの順序のままで、ストレージへの書き込みが並行することもない。
+        with Scraper(timeout_ms=TIMEOUT_MS, user_agents=USER_AGENTS) as scraper, \
+                ThreadPoolExecutor(max_workers=1, thread_name_prefix='step4-save') as save_executor:
             # このループが試行回数を制御する
             for attempt in range(1, MAX_ATTEMPTS + 1):
                 # 処理すべきURLがなければループを抜ける
@@ -217,6 +253,10 @@ def execute(interaction_dir) -> None:
                 logger.info(f"--- [ATTEMPT {attempt}/{MAX_ATTEMPTS}] Processing {len(urls_to_process)} URLs... ---")
 
                 failures_in_this_attempt = []
+                # 保存待ちのページ。SAVE_BATCH_SIZE 件たまるごとにまとめて保存する
+                pending_saves = []
+                # バックグラウンドで保存中のバッチ。同時に保存中にするのは1バッチまで(メモリ上のHTMLが増え続けないように)
+                in_flight_save: Future | None = None
                 total_in_pass = len(urls_to_process) # これは単純に logger での表記用
 
                 for i, (category, url) in enumerate(urls_to_process):
@@ -224,7 +264,8 @@ def execute(interaction_dir) -> None:
 
                     # 最初の試行でのみ、既存チェックを行う。これは、再開可能性（Resumability）」の担保のため。
 #                   # 長時間かかるバッチ処理を設計する際のベストプラクティスの一つ。
-                    if attempt == 1 and output_storage.exists(url):
+                    # 保存時のキーは quote_plus したURLなので、存在確認も同じキーで行う必要がある。
+                    if attempt == 1 and output_storage.exists(urllib.parse.quote_plus(url)):
                         logger.info(f"URL already exists. Skipping.")
                         continue
 
@@ -233,11 +274,11 @@ def execute(interaction_dir) -> None:
                         if not html_content:
                             raise ValueError("Scraping returned None, indicating a failure.")
 
-                        html_io = io.StringIO(html_content)
-                        metadata = {'category': category}
+                        # StringIOで包まず、UTF-8のバイト列にして渡す。ストレージ側はこれをそのまま圧縮/アップロードできる
+                        html_bytes = html_content.encode('utf-8')
                         # スラッシュはGCSで回想とみなされてしまうので、それを + という文字に変換する
                         safe_filename = urllib.parse.quote_plus(url)
-                        output_storage.save(html_io, filename=safe_filename, metadata=metadata)
+                        pending_saves.append((category, url, html_bytes, safe_filename))
 
                     except RedirectedURLSkipException:
                         # リダイレクトによるスキップは「失敗」ではないので、ログにも残さず、
@@ -248,6 +289,16 @@ def execute(interaction_dir) -> None:
                         logger.error(f"Failed on attempt {attempt} for URL {url}: {e}")
                         failures_in_this_attempt.append((category, url))
 
+                    if len(pending_saves) >= SAVE_BATCH_SIZE:
+                        if in_flight_save is not None:
+                            failures_in_this_attempt.extend(in_flight_save.result())
+                        in_flight_save = save_executor.submit(_flush_pending_saves, output_storage, pending_saves)
+                        pending_saves = []
+
+                # この試行で残った保存待ちのページを保存する。失敗リストを確定させるため、バックグラウンドの保存も待つ
+                if in_flight_save is not None:
+                    failures_in_this_attempt.extend(in_flight_save.result())
+                failures_in_this_attempt.extend(_flush_pending_saves(output_storage, pending_saves))
 
                 # 次のループのために、処理対象を今回の失敗リストに更新する
                 urls_to_process = failures_in_this_attempt
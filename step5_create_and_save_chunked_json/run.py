@@ -1,12 +1,12 @@
 import sys
 import os
-import io
 import json
 import re
 from uuid import uuid4
 import urllib.parse
 
-from bs4 import BeautifulSoup
+import lxml.html
+from lxml import etree
 import html2text
 
 import config
@@ -23,44 +23,57 @@ CHUNK_MIN_LENGTH = config.CHUNK_MIN_LENGTH
 CHUNK_MAX_LENGTH = config.CHUNK_MAX_LENGTH
 
 
+def _get_stripped_text(element: lxml.html.HtmlElement) -> str:
+    """BeautifulSoupの get_text(strip=True) と同じく、各テキストノードをstripして連結した文字列を返します。"""
+    return "".join(text.strip() for text in element.xpath('.//text()'))
+
+
 def clean_up_html(html_content: str) -> str:
     """
-    BeautifulSoupを使い、HTMLから不要なタグの除去や構造の整理を行います。
-    共有いただいた過去のスクリプトのロジックをほぼそのまま継承しています。
+    lxmlを使い、HTMLから不要なタグの除去や構造の整理を行います。
+    以前はBeautifulSoupで同じ処理をしていましたが、ツリー操作の大半をlxmlのC実装に任せるため置き換えています。
     """
-    if not html_content:
+    if not html_content or not html_content.strip():
         return ""
 
     # &nbsp; をスペースに置換
     html_content = re.sub(r'&nbsp;', ' ', html_content)
-    soup = BeautifulSoup(html_content, 'html.parser')
+    # article-containerのinner_htmlはルート要素を持たない断片なので、ダミーの<div>で包んでパースする。
+    # このdivはシリアライズ時に取り除く。
+    root = lxml.html.fragment_fromstring(html_content, create_parent='div')
 
     # 不要なカスタムタグや要素を削除
-    for element in soup.find_all(['gkms-context-selector', 'img', 'iframe']):
-        element.decompose()
+    # drop_tree()は、要素の後ろに続くテキスト(tail)を残したまま要素だけを取り除く(decompose()と同じ挙動)
+    for element in root.xpath('.//gkms-context-selector | .//img | .//iframe'):
+        element.drop_tree()
 
     # クリックで展開される部分のヘッダーを<h3>に統一
-    for el in soup.select('div.zippy-container > h2, div.zippy-container > a'):
-        h3 = soup.new_tag('h3')
-        h3.string = el.get_text(strip=True)
-        el.replace_with(h3)
+    # CSSの div.zippy-container と同じく、class属性に zippy-container を含むdivを対象にする
+    zippy_xpath = "//div[contains(concat(' ', normalize-space(@class), ' '), ' zippy-container ')]"
+    for el in root.xpath(f"{zippy_xpath}/h2 | {zippy_xpath}/a"):
+        h3 = lxml.html.Element('h3')
+        h3.text = _get_stripped_text(el)
+        h3.tail = el.tail
+        el.getparent().replace(el, h3)
 
     # 意味を持たない<div>と<span>タグを削除（中のコンテンツは残す）
-    for tag in soup.find_all(['div', 'span']):
-        tag.unwrap()
+    # strip_tagsはツリー全体に対して一度のC呼び出しで処理される。ルートのダミーdiv自体は残る。
+    etree.strip_tags(root, 'div', 'span')
 
     # tableタグの前に改行を挿入して、Markdown変換時のレンダリング崩れを防ぐ
-    for table in soup.find_all('table'):
-        br = soup.new_tag('br')
-        table.insert_before(br)
+    for table in list(root.iter('table')):
+        table.addprevious(lxml.html.Element('br'))
 
     # 空のタグを削除
-    for tag in soup(['a', 'p', 'h1', 'h2', 'h3', 'h4']):
-        if not tag.get_text(strip=True):
-            tag.decompose()
-
+    for tag in root.xpath('.//a | .//p | .//h1 | .//h2 | .//h3 | .//h4'):
+        if not _get_stripped_text(tag):
+            tag.drop_tree()
+
+    # ダミーのルートdivを除いた中身だけをシリアライズする
+    cleaned_html = (root.text or "") + "".join(
+        lxml.html.tostring(child, encoding='unicode') for child in root
+    )
     # 3回以上の連続改行を2回にまとめる
-    cleaned_html = str(soup)
     cleaned_html = re.sub(r'(\n[ \t]*){3,}', '\n\n', cleaned_html)
 
     return cleaned_html
@@ -156,7 +169,9 @@ def execute(interaction_dir):
         page_count = 0 # これは単にログの記録に使うためだけの変数
 
         # 3. イテレータを使って全ページをメモリ効率よく処理
-        page_iterator = input_storage.get_storage_iterator()
+        # 1ページごとにタプルを作らず、同じリストを上書きしながら返すイテレータを使う。
+        # ループの先頭ですぐに各変数へ取り出しているので、リストが次のページで上書きされても問題ない。
+        page_iterator = input_storage.get_storage_iterator_into([])
 
         # scraped_atは、sqliteからUTCの文字列として取り出される。これはそのままJSONに保存できる日時形式。
         for category, safe_url, html_content, scraped_at in page_iterator:
@@ -186,10 +201,11 @@ def execute(interaction_dir):
         logger.info(f"Processed {page_count} pages and generated a total of {len(all_chunks_list)} chunks.")
         logger.info(f"Preparing to save chunks to '{STEP5_OUTPUT_FILENAME}'...")
 
-        json_string = json.dumps(all_chunks_list, ensure_ascii=False, indent=2)
-        json_io = io.StringIO(json_string)
+        # step6は整形を必要としないので、インデントや区切りの空白を入れずに書き出してサイズとエンコード時間を抑える
+        json_string = json.dumps(all_chunks_list, ensure_ascii=False, separators=(',', ':'))
 
-        output_storage.save(json_io, filename=STEP5_OUTPUT_FILENAME)
+        # save()は文字列をそのまま受け付けるので、StringIOに包み直す(=全体をもう一度コピーする)必要はない
+        output_storage.save(json_string, filename=STEP5_OUTPUT_FILENAME)
         logger.info(f"Successfully saved all chunks to '{STEP5_OUTPUT_FILENAME}'.")
 
     except (StorageError, NotImplementedError) as e:
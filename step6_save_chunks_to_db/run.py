@@ -4,10 +4,10 @@ import json
 from datetime import datetime
 import uuid
 
-from sqlalchemy import create_engine, delete
+from sqlalchemy import delete
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.exc import SQLAlchemyError
-from database import Base
+from database import Base, get_engine
 from models.Chunk import Chunk
 
 import config
@@ -20,7 +20,6 @@ logger = logging.getLogger(__name__)
 APP_ENV = config.APP_ENV
 OUTPUT_BASE_DIR = config.OUTPUT_BASE_DIR
 STEP5_OUTPUT_FILENAME = config.STEP5_OUTPUT_FILENAME
-DATABASE_URL = config.DATABASE_URL
 
 
 def execute(interaction_dir):
@@ -36,9 +35,9 @@ def execute(interaction_dir):
 
         # 2. chunks.jsonを読み込み、Pythonオブジェクトに変換
         logger.info(f"Reading chunks from '{STEP5_OUTPUT_FILENAME}'...")
-        json_io = input_storage.read(STEP5_OUTPUT_FILENAME)
+        json_string = input_storage.read(STEP5_OUTPUT_FILENAME)
         # ここでJSONファイルを辞書のリストに変換するが、日時を表す文字列はdatetimeオブジェクトに変換されず、文字列のまま。
-        all_chunks_list = json.load(json_io)
+        all_chunks_list = json.loads(json_string)
 
         if not all_chunks_list:
             logger.warning("No chunks found in the input file. Nothing to save to the database.")
@@ -50,7 +49,7 @@ def execute(interaction_dir):
         # 3. データベースへの接続設定
         logger.info("Connecting to the database...")
 
-        engine = create_engine(DATABASE_URL)
+        engine = get_engine()
 
         # テーブルが存在しない場合は作成する
         # Base.metadata.create_all(engine)
@@ -1,6 +1,10 @@
 import sys
 import os
-from sqlalchemy import create_engine
+import queue
+from datetime import datetime
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import select, Row
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.exc import SQLAlchemyError
 
@@ -10,6 +14,7 @@ import vertexai
 from vertexai.language_models import TextEmbeddingModel
 
 import config
+from database import get_engine
 from models.Chunk import Chunk
 
 import logging
@@ -17,6 +22,191 @@ from config_logging import setup_logging
 logger = logging.getLogger(__name__)
 
 OUTPUT_BASE_DIR = config.OUTPUT_BASE_DIR
+EMBEDDING_BATCH_SIZE = config.EMBEDDING_BATCH_SIZE
+VECTOR_SEARCH_UPSERT_BATCH_SIZE = config.VECTOR_SEARCH_UPSERT_BATCH_SIZE
+EMBEDDING_MAX_WORKERS = config.EMBEDDING_MAX_WORKERS
+VECTOR_SEARCH_UPSERT_MAX_WORKERS = config.VECTOR_SEARCH_UPSERT_MAX_WORKERS
+EMBEDDING_QUEUE_MAXSIZE = config.EMBEDDING_QUEUE_MAXSIZE
+
+# コンシューマーに「もうデータは来ない」ことを知らせるための番兵
+_END_OF_QUEUE = object()
+
+
+def _build_restricts(scraped_at: datetime, restricts_cache: dict[datetime, tuple[str, str]]) -> list[dict]:
+    """
+    Builds the restricts metadata for a chunk.
+    strftime()とtimestamp()の結果は scraped_at ごとにキャッシュする。
+    同じページから作られたチャンクは同じ scraped_at を持つので、呼び出し回数はページ数程度まで減る。
+    なお、timestampは秒単位なので、日付(date)ではなく scraped_at そのものをキーにする必要がある。
+    """
+    cached = restricts_cache.get(scraped_at)
+    if cached is None:
+        cached = (scraped_at.strftime("%Y-%m-%d"), str(int(scraped_at.timestamp())))
+        restricts_cache[scraped_at] = cached
+    scraped_at_date, scraped_at_timestamp = cached
+
+    return [
+        {
+            "namespace": "scraped_at",
+            "allow_list": [scraped_at_date]
+        },
+        {
+            "namespace": "scraped_at_timestamp",
+            "allow_list": [scraped_at_timestamp]
+        }
+    ]
+
+
+def _build_datapoint(chunk: Row, embedding: list[float], restricts_cache: dict[datetime, tuple[str, str]]) -> dict:
+    """Builds a Vector Search datapoint (with restricts metadata) for a single chunk."""
+    return {
+        "datapoint_id": str(chunk.id),
+        "feature_vector": embedding,
+        "restricts": _build_restricts(chunk.scraped_at, restricts_cache)
+    }
+
+
+def _embed_batch(model, all_chunks: Sequence[Row], batch_start_idx: int, num_batches: int, embed_queue: queue.Queue) -> int:
+    """
+    Producer: 1バッチ分のテキストをベクトル化し、結果をキューに積む。
+    キューが満杯の場合は put() がブロックするので、upsert側が追いつくまで自然に待たされる。
+    戻り値は生成できたembeddingの件数。
+    """
+    # 全チャンク分のテキストリストを先に作ると全件分のリストがもう一つメモリに乗るので、バッチ単位でだけ作る
+    batch_texts = [chunk.content for chunk in all_chunks[batch_start_idx:batch_start_idx + EMBEDDING_BATCH_SIZE]]
+    current_batch_num = batch_start_idx // EMBEDDING_BATCH_SIZE + 1
+    logger.info(f"Generating embeddings for batch {current_batch_num}/{num_batches} ({len(batch_texts)} texts)...")
+
+    try:
+        embeddings = model.get_embeddings(batch_texts)
+    except google.api_core.exceptions.GoogleAPICallError as e:
+        logger.error(f"Failed to generate embeddings for batch {current_batch_num}/{num_batches}: {e}", exc_info=True)
+        logger.warning(f"Skipping batch {current_batch_num}/{num_batches} due to API error")
+        return 0
+    except Exception as e:
+        logger.error(f"Unexpected error while generating embeddings for batch {current_batch_num}/{num_batches}: {e}", exc_info=True)
+        logger.warning(f"Skipping batch {current_batch_num}/{num_batches} due to unexpected error")
+        return 0
+
+    # .values だけのリストを作り直さず、APIの戻り値をそのままキューに渡す
+    embed_queue.put((batch_start_idx, embeddings))
+    logger.info(f"Successfully generated embeddings for batch {current_batch_num}/{num_batches}")
+    return len(embeddings)
+
+
+def _upsert_datapoints(my_index, batch_datapoints: list[dict]) -> int:
+    """Upserts one batch of datapoints. Returns the number of datapoints upserted (0 on failure)."""
+    logger.info(f"Upserting batch ({len(batch_datapoints)} datapoints)...")
+    try:
+        my_index.upsert_datapoints(datapoints=batch_datapoints)
+        logger.info(f"Successfully upserted batch ({len(batch_datapoints)} datapoints)")
+        return len(batch_datapoints)
+    except google.api_core.exceptions.GoogleAPICallError as e:
+        logger.error(f"Failed to upsert batch ({len(batch_datapoints)} datapoints): {e}", exc_info=True)
+        logger.warning("Skipping upsert for this batch due to API error")
+    except Exception as e:
+        logger.error(f"Unexpected error while upserting batch ({len(batch_datapoints)} datapoints): {e}", exc_info=True)
+        logger.warning("Skipping upsert for this batch due to unexpected error")
+    return 0
+
+
+def _upsert_pending(
+    my_index,
+    all_chunks: Sequence[Row],
+    pending: list[tuple[int, list[float]]],
+    restricts_cache: dict[datetime, tuple[str, str]]
+) -> int:
+    """Builds datapoints for one upsert batch only and upserts them."""
+    try:
+        batch_datapoints = [
+            _build_datapoint(all_chunks[chunk_idx], embedding, restricts_cache)
+            for chunk_idx, embedding in pending
+        ]
+    except Exception as e:
+        # ここで例外を投げてConsumerが止まると、Producerが満杯のキューで永久に待つことになるので、ログだけ残して続行する
+        logger.error(f"Failed to build datapoints for an upsert batch: {e}", exc_info=True)
+        return 0
+    return _upsert_datapoints(my_index, batch_datapoints)
+
+
+def _upsert_worker(
+    my_index,
+    all_chunks: Sequence[Row],
+    embed_queue: queue.Queue,
+    restricts_cache: dict[datetime, tuple[str, str]]
+) -> int:
+    """
+    Consumer: キューからembeddingを取り出し、VECTOR_SEARCH_UPSERT_BATCH_SIZE 件たまるごとにupsertする。
+    番兵を受け取ったら、残りをupsertして終了する。戻り値はupsertできた件数。
+    予期しない例外が起きた場合は、番兵が来るまでキューを読み捨て続けてから、その例外を送出する(呼び出し元の future.result() で再送出される)。
+    """
+    # ここでは (チャンクのインデックス, embedding) の組だけを溜めておき、
+    # datapointの辞書はupsertする直前に1バッチ分だけ作る。
+    pending = []
+    upserted_count = 0
+    error = None
+
+    while True:
+        item = embed_queue.get()
+        if item is _END_OF_QUEUE:
+            break
+        if error is not None:
+            # ここで抜けると、Producerが満杯のキューの put() で永久に待つことになるので、失敗後も番兵までは読み捨てる
+            continue
+
+        try:
+            batch_start_idx, embeddings = item
+            for chunk_idx, embedding in enumerate(embeddings, start=batch_start_idx):
+                pending.append((chunk_idx, embedding.values))
+
+            while len(pending) >= VECTOR_SEARCH_UPSERT_BATCH_SIZE:
+                upserted_count += _upsert_pending(my_index, all_chunks, pending[:VECTOR_SEARCH_UPSERT_BATCH_SIZE], restricts_cache)
+                del pending[:VECTOR_SEARCH_UPSERT_BATCH_SIZE]
+        except Exception as e:
+            logger.error(f"Upsert consumer failed; discarding the remaining embeddings it receives: {e}", exc_info=True)
+            error = e
+
+    if error is not None:
+        raise error
+
+    if pending:
+        upserted_count += _upsert_pending(my_index, all_chunks, pending, restricts_cache)
+
+    return upserted_count
+
+
+def _embed_and_upsert(model, my_index, all_chunks: Sequence[Row]) -> tuple[int, int]:
+    """
+    Embedding生成(Producer)とupsert(Consumer)を別々のスレッドプールで並行して実行する。
+    両者は maxsize 付きの queue.Queue でつながっており、ネットワーク待ちの時間を互いに重ね合わせられる。
+    戻り値は (生成できたembedding数, upsertできたdatapoint数)。
+    """
+    num_batches = (len(all_chunks) - 1) // EMBEDDING_BATCH_SIZE + 1
+    embed_queue = queue.Queue(maxsize=EMBEDDING_QUEUE_MAXSIZE)
+    # 全Consumerで共有する。dictへの単純な読み書きはGILにより安全で、競合しても同じ値を書くだけなので問題ない
+    restricts_cache = {}
+
+    with ThreadPoolExecutor(max_workers=VECTOR_SEARCH_UPSERT_MAX_WORKERS) as upsert_executor:
+        upsert_futures = [
+            upsert_executor.submit(_upsert_worker, my_index, all_chunks, embed_queue, restricts_cache)
+            for _ in range(VECTOR_SEARCH_UPSERT_MAX_WORKERS)
+        ]
+        try:
+            with ThreadPoolExecutor(max_workers=EMBEDDING_MAX_WORKERS) as embed_executor:
+                embed_futures = [
+                    embed_executor.submit(_embed_batch, model, all_chunks, i, num_batches, embed_queue)
+                    for i in range(0, len(all_chunks), EMBEDDING_BATCH_SIZE)
+                ]
+                embedded_count = sum(future.result() for future in embed_futures)
+        finally:
+            # Producerが全て終わった（または失敗した）ら、Consumerの数だけ番兵を積んで終了させる
+            for _ in range(VECTOR_SEARCH_UPSERT_MAX_WORKERS):
+                embed_queue.put(_END_OF_QUEUE)
+
+        upserted_count = sum(future.result() for future in upsert_futures)
+
+    return embedded_count, upserted_count
+
 
 def execute():
     """
@@ -29,10 +219,12 @@ def execute():
         # 1. データベースから全てのチャンクを取得
         logger.info("Connecting to the database to fetch chunks...")
         try:
-            engine = create_engine(config.DATABASE_URL)
+            engine = get_engine()
             Session = sessionmaker(bind=engine)
             with Session() as session:
-                all_chunks = session.query(Chunk).all()
+                # 必要なのは3カラムだけなので、ORMオブジェクト(identity mapへの登録など)を作らず、
+                # Coreレベルのselectでタプル(Row)として取得する。Rowは chunk.content のように属性アクセスできる。
+                all_chunks = session.execute(select(Chunk.id, Chunk.content, Chunk.scraped_at)).all()
         except SQLAlchemyError as e:
             logger.error("Failed to connect to or read from the database.", exc_info=True)
             raise
@@ -51,46 +243,8 @@ def execute():
         logger.info(f"Loading embedding model: '{config.EMBEDDING_MODEL_NAME}'...")
         model = TextEmbeddingModel.from_pretrained(config.EMBEDDING_MODEL_NAME)
 
-        # 3. チャンクのコンテンツをバッチ処理でベクトル化
-        logger.info(f"Generating embeddings for {len(all_chunks)} chunks...")
-
-        all_texts = [chunk.content for chunk in all_chunks]
-        all_ids = [str(chunk.id) for chunk in all_chunks]
-        all_embeddings = []
-        successful_chunk_indices = []  # 成功したチャンクのインデックスを記録
-
-        # config.EMBEDDING_BATCH_SIZE ごとに分割してAPIを呼び出し、ベクトル化
-        num_batches = (len(all_texts) - 1) // config.EMBEDDING_BATCH_SIZE + 1
-
-        for i in range(0, len(all_texts), config.EMBEDDING_BATCH_SIZE):
-            batch_texts = all_texts[i:i + config.EMBEDDING_BATCH_SIZE]
-            current_batch_num = i // config.EMBEDDING_BATCH_SIZE + 1
-            batch_start_idx = i
-            logger.info(f"Generating embeddings for batch {current_batch_num}/{num_batches} ({len(batch_texts)} texts)...")
-
-            try:
-                embeddings = model.get_embeddings(batch_texts)
-                all_embeddings.extend([emb.values for emb in embeddings])
-                # 成功したチャンクのインデックスを記録
-                successful_chunk_indices.extend(range(batch_start_idx, batch_start_idx + len(embeddings)))
-                logger.info(f"Successfully generated embeddings for batch {current_batch_num}/{num_batches}")
-            except google.api_core.exceptions.GoogleAPICallError as e:
-                logger.error(f"Failed to generate embeddings for batch {current_batch_num}/{num_batches}: {e}", exc_info=True)
-                logger.warning(f"Skipping batch {current_batch_num}/{num_batches} due to API error")
-                continue
-            except Exception as e:
-                logger.error(f"Unexpected error while generating embeddings for batch {current_batch_num}/{num_batches}: {e}", exc_info=True)
-                logger.warning(f"Skipping batch {current_batch_num}/{num_batches} due to unexpected error")
-                continue
-
-        if not all_embeddings:
-            logger.error("No embeddings were successfully generated. Aborting upsert.")
-            logger.info("--- Step 7: Finished with errors (No embeddings) ---")
-            return
-
-        logger.info(f"Successfully generated {len(all_embeddings)} embeddings out of {len(all_texts)} chunks.")
-
-        # 4. Vector Search Indexに接続
+        # 3. Vector Search Indexに接続
+        # embeddingを生成しながら並行してupsertするため、先にIndexへ接続しておく
         logger.info(f"Connecting to Vector Search Index: '{config.VECTOR_SEARCH_INDEX_ID}'...")
         try:
             my_index = aiplatform.MatchingEngineIndex(index_name=config.VECTOR_SEARCH_INDEX_ID)
@@ -99,55 +253,18 @@ def execute():
             logger.error(f"Failed to connect to Vector Search Index: {e}", exc_info=True)
             raise
 
-        # 5. データをVector Search Indexにバッチでアップサート
-        logger.info(f"Upserting {len(all_embeddings)} vectors into the index...")
-
-        # Vector Searchにアップサートするためのデータ形式のリストを作成（メタデータ付き）
-        datapoints = []
-        for idx, (chunk_idx, embedding) in enumerate(zip(successful_chunk_indices, all_embeddings)):
-            chunk = all_chunks[chunk_idx]
-            chunk_id = str(chunk.id)
-
-            # メタデータの準備
-            restricts = [
-                {
-                    "namespace": "scraped_at",
-                    "allow_list": [chunk.scraped_at.strftime("%Y-%m-%d")]
-                },
-                {
-                    "namespace": "scraped_at_timestamp",
-                    "allow_list": [str(int(chunk.scraped_at.timestamp()))]
-                }
-            ]
-
-            datapoint = {
-                "datapoint_id": chunk_id,
-                "feature_vector": embedding,
-                "restricts": restricts
-            }
-            datapoints.append(datapoint)
-
-        # config.VECTOR_SEARCH_UPSERT_BATCH_SIZE ごとに分割してアップサート
-        num_upsert_batches = (len(datapoints) - 1) // config.VECTOR_SEARCH_UPSERT_BATCH_SIZE + 1
-
-        for i in range(0, len(datapoints), config.VECTOR_SEARCH_UPSERT_BATCH_SIZE):
-            batch_datapoints = datapoints[i:i + config.VECTOR_SEARCH_UPSERT_BATCH_SIZE]
-            current_batch_num = i // config.VECTOR_SEARCH_UPSERT_BATCH_SIZE + 1
-            logger.info(f"Upserting batch {current_batch_num}/{num_upsert_batches} ({len(batch_datapoints)} datapoints)...")
-
-            try:
-                my_index.upsert_datapoints(datapoints=batch_datapoints)
-                logger.info(f"Successfully upserted batch {current_batch_num}/{num_upsert_batches}")
-            except google.api_core.exceptions.GoogleAPICallError as e:
-                logger.error(f"Failed to upsert batch {current_batch_num}/{num_upsert_batches}: {e}", exc_info=True)
-                logger.warning(f"Skipping upsert for batch {current_batch_num}/{num_upsert_batches} due to API error")
-                continue
-            except Exception as e:
-                logger.error(f"Unexpected error while upserting batch {current_batch_num}/{num_upsert_batches}: {e}", exc_info=True)
-                logger.warning(f"Skipping upsert for batch {current_batch_num}/{num_upsert_batches} due to unexpected error")
-                continue
-
-        logger.info("Finished upserting vectors to Vector Search.")
+        # 4. ベクトル化とアップサートをパイプラインで並行実行
+        # config.EMBEDDING_BATCH_SIZE ごとにベクトル化し、config.VECTOR_SEARCH_UPSERT_BATCH_SIZE ごとにアップサートする
+        logger.info(f"Generating embeddings for {len(all_chunks)} chunks and upserting them into the index...")
+        embedded_count, upserted_count = _embed_and_upsert(model, my_index, all_chunks)
+
+        if not embedded_count:
+            logger.error("No embeddings were successfully generated. Nothing was upserted.")
+            logger.info("--- Step 7: Finished with errors (No embeddings) ---")
+            return
+
+        logger.info(f"Successfully generated {embedded_count} embeddings out of {len(all_chunks)} chunks.")
+        logger.info(f"Finished upserting {upserted_count}/{embedded_count} vectors to Vector Search.")
 
     except (SQLAlchemyError, google.api_core.exceptions.GoogleAPICallError) as e:
         logger.critical(f"A critical error occurred with the database or Google Cloud API: {e}", exc_info=True)
@@ -170,4 +287,4 @@ if __name__ == "__main__":
         interaction_dir = os.path.join(OUTPUT_BASE_DIR, 'test')
 
     setup_logging(base_dir=interaction_dir)
-    execute()
\ No newline at end of file
+    execute()
@@ -1,16 +1,70 @@
 import os
+import errno
 import io
+import csv
+import codecs
+import itertools
+import mmap
+import shutil
+import stat
 import pathlib
+import tempfile
 from abc import ABC, abstractmethod
+from typing import BinaryIO
 import sqlite3
-from collections.abc import Iterator #これはコード内で戻り値に対しイテレーター型を型表記で使うため
+import hashlib
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from functools import lru_cache
+from collections.abc import Iterator, Iterable, Sequence, Callable #これはコード内で戻り値に対しイテレーター型を型表記で使うため
 import config
-from google.cloud import storage
+from utils import convert_rows_to_in_memory_csv_bytes
 from google.api_core import exceptions
+import logging
 from datetime import datetime, timezone
+import zstandard
+
+# save/read/exists は1URLごとに呼ばれるので、そこでのログはdebugレベルにし、f-stringではなく引数で渡す。
+# こうするとDEBUGが無効な場合(デフォルトのINFO)は、レベル比較だけで返り、文字列の組み立ても出力も行われない。
+logger = logging.getLogger(__name__)
 
 GCS_BUCKET_NAME = config.GCS_BUCKET_NAME
 SQLITE_DB_FILENAME = config.SQLITE_DB_FILENAME
+# SQLiteに保存するHTMLのzstd圧縮レベル。3はzstdの既定値で、HTMLなら圧縮/展開ともにディスクI/Oより十分速い
+SQLITE_ZSTD_LEVEL = 3
+# 保存済みのHTMLと同じ内容かどうかを判定するためのハッシュ(blake2b)のバイト数
+CONTENT_HASH_SIZE = 16
+# 保存時に StringIO から何文字ずつ読み出してUTF-8にエンコードする(SQLiteではさらに圧縮器に流し込む)か
+ENCODE_CHUNK_CHARS = 64 * 1024
+GCS_UPLOAD_CHUNK_SIZE = config.GCS_UPLOAD_CHUNK_SIZE
+GCS_UPLOAD_MAX_WORKERS = config.GCS_UPLOAD_MAX_WORKERS
+GCS_MULTIPART_THRESHOLD = config.GCS_MULTIPART_THRESHOLD
+GCS_MULTIPART_CHUNK_SIZE = config.GCS_MULTIPART_CHUNK_SIZE
+GCS_MULTIPART_MAX_WORKERS = config.GCS_MULTIPART_MAX_WORKERS
+GCS_DEFAULT_CACHE_CONTROL = config.GCS_DEFAULT_CACHE_CONTROL
+GCS_DOWNLOAD_THRESHOLD = config.GCS_DOWNLOAD_THRESHOLD
+GCS_DOWNLOAD_CHUNK_SIZE = config.GCS_DOWNLOAD_CHUNK_SIZE
+GCS_DOWNLOAD_MAX_WORKERS = config.GCS_DOWNLOAD_MAX_WORKERS
+GCS_ITERATOR_MAX_WORKERS = config.GCS_ITERATOR_MAX_WORKERS
+GCS_ITERATOR_PREFETCH = config.GCS_ITERATOR_PREFETCH
+# GCSクライアントのHTTPコネクションプールに保持する接続数の上限。同じクライアントを同時に使う最大のスレッド数に合わせる。
+# 一番多いのはページのイテレータで、GCS_ITERATOR_MAX_WORKERS 本のスレッドがそれぞれ大きなページを GCS_DOWNLOAD_MAX_WORKERS 本で並列ダウンロードしうる。
+# (接続は必要になった時に作られるので、上限を大きくしても使わない分のコストはかからない)
+GCS_HTTP_POOL_MAXSIZE = max(
+    GCS_UPLOAD_MAX_WORKERS,
+    GCS_MULTIPART_MAX_WORKERS,
+    GCS_ITERATOR_MAX_WORKERS * GCS_DOWNLOAD_MAX_WORKERS,
+)
+# ローカルファイルの読み込みで、このサイズ以上のファイルだけmmapを使う。小さいファイルではmmapの準備コストの方が大きい
+LOCAL_MMAP_THRESHOLD = 1024 * 1024
+# save_rows でCSVを直接ファイルに書き出す際のバッファサイズ
+LOCAL_WRITE_BUFFER_SIZE = 1024 * 1024
+# iter_read で一度に返す文字数のデフォルト
+READ_CHUNK_CHARS = 1024 * 1024
+# iter_read でローカルファイルを読む際のバッファサイズ
+LOCAL_READ_BUFFER_SIZE = 1024 * 1024
 
 class StorageError(Exception):
     pass
@@ -18,23 +72,420 @@ class StorageFileNotFoundError(StorageError):
     pass
 class StoragePermissionError(StorageError):
     pass
+class StorageBatchError(StorageError):
+    """Raised by save_many when some items failed; failures holds (filename, exception) for each of them."""
+    def __init__(self, message: str, failures: list[tuple[str, Exception]]):
+        super().__init__(message)
+        self.failures = failures
 
 # To use GCS, you need to install the library:
 # pip install google-cloud-storage
-# from google.cloud import storage
+# google.cloud.storage はimportするだけで認証周りやgRPC/protobufまで読み込まれ重いので、モジュール先頭ではimportせず、
+# GCSの戦略が実際に使われる時に _get_gcs_client() の中で初めてimportする。(開発環境ではimportされない)
+@lru_cache(maxsize=None)
+def _get_gcs_credentials() -> tuple:
+    """
+    Resolves the application default credentials (and project) once per process.
+    共有クライアントもスレッドごとのクライアントも同じ認証情報を使うので、認証情報の探索(環境変数やメタデータサーバーへの問い合わせ)は一度だけにする。
+    """
+    import google.auth
+    from google.cloud import storage
+    return google.auth.default(scopes=storage.Client.SCOPE)
+
+
+def _new_gcs_client():
+    """
+    Creates a google.cloud.storage.Client with its own HTTP session, using the shared credentials.
+    ダウンロードの並列処理(transfer_managerやページのイテレータ)で全スレッドがコネクションを使い回せるよう、
+    HTTPコネクションプールを GCS_HTTP_POOL_MAXSIZE まで広げたセッションを作り、コンストラクタの _http 引数で渡す。
+    (requestsのデフォルトは10で、それを超えた分は使い捨ての接続になり、"Connection pool is full" の警告が出る)
+    """
+    from google.cloud import storage
+    from google.auth.transport.requests import AuthorizedSession
+    from requests.adapters import HTTPAdapter
+    credentials, project = _get_gcs_credentials()
+    session = AuthorizedSession(credentials)
+    # pool_connections はホストごとのプールをいくつ保持するかの数(接続先はGCSと認証のエンドポイントだけ)なので、デフォルトのままにする
+    session.mount('https://', HTTPAdapter(pool_maxsize=GCS_HTTP_POOL_MAXSIZE))
+    # project=None を明示的に渡すと「プロジェクトなし」の扱いになるので、分からない場合は渡さずにクライアントの推定に任せる
+    kwargs = {'project': project} if project is not None else {}
+    return storage.Client(credentials=credentials, _http=session, **kwargs)
+
+
+@lru_cache(maxsize=None)
+def _get_gcs_client():
+    """
+    Returns a process-wide google.cloud.storage.Client, creating it on first use.
+    複数のGCS戦略インスタンス(step4の入力/出力など)で同じクライアントを共有し、認証とHTTPコネクションプールを使い回す。
+    """
+    return _new_gcs_client()
+
+
+_gcs_thread_local = threading.local()
+
+
+def _get_thread_gcs_client():
+    """
+    Returns a google.cloud.storage.Client owned by the calling thread.
+    save_many のアップロード用スレッドでは、1つのクライアント(=1つのHTTPセッション)を全スレッドで取り合わないよう、スレッドごとにクライアントを持つ。
+    認証情報は _get_gcs_credentials() で一度だけ解決したものを使い回すので、スレッドごとに認証情報の探索をやり直すことはない。
+    """
+    client = getattr(_gcs_thread_local, 'client', None)
+    if client is None:
+        client = _gcs_thread_local.client = _new_gcs_client()
+    return client
+
+
+@lru_cache(maxsize=None)
+def _get_upload_executor() -> ThreadPoolExecutor:
+    """
+    Returns the process-wide thread pool used by save_many.
+    スレッドを呼び出しのたびに作り直すと、スレッドごとのクライアント(とそのコネクション)も毎回作り直しになるので、プールを使い回す。
+    """
+    return ThreadPoolExecutor(
+        max_workers=GCS_UPLOAD_MAX_WORKERS, thread_name_prefix='gcs-upload', initializer=_mark_upload_worker
+    )
+
+
+def _mark_upload_worker():
+    _gcs_thread_local.upload_worker = True
+
+
+def _upload_bucket(strategy: 'StorageStrategy'):
+    """Returns the bucket to upload through: the per-thread client's bucket on save_many workers, otherwise strategy.bucket."""
+    if getattr(_gcs_thread_local, 'upload_worker', False):
+        return _get_thread_gcs_client().bucket(strategy.bucket_name)
+    return strategy.bucket
+
+
+def _cached_blob_names(strategy: 'StorageStrategy') -> set[str]:
+    """
+    Returns the set of blob names under strategy's prefix, listing them once on first use.
+    exists() のたびにオブジェクトごとのリクエスト(1往復)を投げる代わりに、プレフィックス配下を一度だけ一覧して名前のsetで判定する。
+    """
+    names = strategy._name_cache
+    if names is None:
+        with strategy._name_cache_lock:
+            if strategy._name_cache is None:
+                # fields で名前とページトークンだけを返させ、一覧のレスポンスからメタデータ分を省く
+                blobs = strategy.client.list_blobs(
+                    strategy.bucket, prefix=strategy._prefix, fields='items(name),nextPageToken'
+                )
+                strategy._name_cache = {blob.name for blob in blobs}
+            names = strategy._name_cache
+    return names
+
+
+def _save_many_concurrently(
+    strategy: 'StorageStrategy', items: Iterable['SaveItem'], executor: ThreadPoolExecutor | None = None
+):
+    """
+    Calls strategy.save() (or save_bytes() for bytes) for each item on a thread pool (the GCS upload pool by default).
+    GCSへのアップロードは1件ごとの待ち時間(レイテンシ)が支配的なので、並列に投げることでスループットが大きく上がる。
+    1件の失敗でバッチ全体を止めず、全件の完了を待ってから、失敗した分をまとめて StorageBatchError として送出する。
+    (呼び出し側は failures から失敗したファイルだけを再試行できる)
+    """
+    items = list(items)
+    if not items:
+        return
+
+    errors = []
+    if executor is None:
+        executor = _get_upload_executor()
+    futures = {
+        executor.submit(strategy._save_item, buf, filename, metadata): filename
+        for buf, filename, metadata in items
+    }
+    for future in as_completed(futures):
+        try:
+            future.result()
+        except Exception as e:
+            # 個々の失敗は、save()/save_bytes() と同じく StorageError(とその派生)として記録する
+            if not isinstance(e, StorageError):
+                e = StorageError(f"Failed to save '{futures[future]}': {e}")
+            errors.append((futures[future], e))
+
+    if errors:
+        failed_names = ", ".join(filename for filename, _e in errors[:5])
+        raise StorageBatchError(
+            f"Failed to save {len(errors)} of {len(items)} files (e.g. {failed_names}): {errors[0][1]}",
+            failures=errors,
+        ) from errors[0][1]
+
+
+def _encode_to_bytes_io(string_io: io.StringIO) -> io.BytesIO:
+    """
+    Encodes the whole content of a StringIO as UTF-8 into a BytesIO, a chunk at a time.
+    getvalue().encode() だと、StringIOの内部バッファから全体の文字列をコピーし、さらにそれをエンコードしたバイト列を作るので、
+    一時的に全体の文字列とバイト列の両方がメモリに載る。一定の文字数ずつ読み出してエンコードすれば、全体として作られるのはバイト列だけになる。
+    """
+    # getvalue()と同じく、読み出し位置に関係なく先頭から全体を対象にする
+    string_io.seek(0)
+    bytes_io = io.BytesIO()
+    while chunk := string_io.read(ENCODE_CHUNK_CHARS):
+        bytes_io.write(chunk.encode('utf-8'))
+    bytes_io.seek(0)
+    return bytes_io
+
+
+def _to_utf8_bytes(data: 'SaveData') -> bytes | memoryview | io.BytesIO:
+    """
+    Returns data as UTF-8 bytes, encoding only when it is text.
+    すでにバイト列であればコピーせずにそのまま返す。StringIO は全体の文字列を作らずにチャンクごとにエンコードする。
+    """
+    if isinstance(data, str):
+        return data.encode('utf-8')
+    if isinstance(data, io.StringIO):
+        return _encode_to_bytes_io(data)
+    return data
+
+
+def _upload_chunks_concurrently(blob, file_obj: io.BytesIO, content_type: str):
+    """
+    Uploads a large payload as parallel parts with transfer_manager.upload_chunks_concurrently.
+    1本のHTTPストリームではスループットに上限があるので、複数のパートを並列の接続で送る。
+    upload_chunks_concurrently はファイルパスから読み込む仕様なので、一時ディレクトリ内のファイルに書き出してから渡す。
+    """
+    from google.cloud.storage import transfer_manager
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_path = pathlib.Path(tmp_dir) / 'upload'
+        with open(tmp_path, 'wb') as f:
+            f.write(file_obj.getbuffer())
+        transfer_manager.upload_chunks_concurrently(
+            str(tmp_path),
+            blob,
+            content_type=content_type,
+            chunk_size=GCS_MULTIPART_CHUNK_SIZE,
+            worker_type=transfer_manager.THREAD,
+            max_workers=GCS_MULTIPART_MAX_WORKERS,
+        )
+
+
+def _upload_bytes(blob, buf: bytes | memoryview | io.BytesIO, content_type: str, cache_control: str | None = None):
+    """
+    Uploads UTF-8 encoded bytes to a GCS blob via upload_from_file.
+    BytesIOを受け取った場合は、コピーせずにそのままアップロードする。
+    blob.chunk_size を設定しておくと、GCS_UPLOAD_CHUNK_SIZE を超えるデータはresumable uploadで
+    チャンクごとに送信されるので、巨大な1リクエストでまとめて送ることがなくなる。
+    (それ以下のサイズでは、ライブラリが自動的に1回のmultipartアップロードを選ぶ)
+    GCS_MULTIPART_THRESHOLD を超える場合は、transfer_managerで複数のパートを並列にアップロードする。
+    cache_control を指定すると、オブジェクトの Cache-Control メタデータとして一緒に保存する。
+    """
+    file_obj = buf if isinstance(buf, io.BytesIO) else io.BytesIO(buf)
+    if cache_control:
+        blob.cache_control = cache_control
+    if file_obj.getbuffer().nbytes > GCS_MULTIPART_THRESHOLD:
+        _upload_chunks_concurrently(blob, file_obj, content_type)
+        return
+    blob.chunk_size = GCS_UPLOAD_CHUNK_SIZE
+    blob.upload_from_file(
+        file_obj,
+        rewind=True,
+        size=file_obj.getbuffer().nbytes,
+        content_type=content_type
+    )
+
+
+def _download_text(blob) -> str:
+    """
+    Downloads a blob and decodes it as UTF-8.
+    GCS_DOWNLOAD_THRESHOLD を超える大きなファイルは、transfer_managerでRange GETを並列に発行してダウンロードする。
+    (1本のHTTP GETより、複数ストリームの方がスループットが出る)
+    """
+    if blob.size is None:
+        # bucket.blob(name) で作ったblobはサイズを持っていない。サイズを調べるためだけにメタデータを取得(reload)すると、
+        # 小さなファイルの読み込みが毎回2往復になってしまうので、まず先頭の GCS_DOWNLOAD_THRESHOLD + 1 バイトをRange GETで取得する。
+        # それ以下の大きさのファイルなら、この1回のGETで全体が取れる。存在しない場合は NotFound が送出される。
+        try:
+            head = blob.download_as_bytes(start=0, end=GCS_DOWNLOAD_THRESHOLD)
+        except exceptions.RequestRangeNotSatisfiable:
+            # 空のオブジェクトには、どのバイト範囲も存在しない
+            return ''
+        if len(head) <= GCS_DOWNLOAD_THRESHOLD:
+            return head.decode('utf-8')
+        # しきい値を超える大きなファイルの場合だけ、サイズを知るためにメタデータを取得して並列ダウンロードに切り替える
+        blob.reload()
+    elif blob.size <= GCS_DOWNLOAD_THRESHOLD:
+        # list_blobs で取得したblobなどは、サイズが分かっているので1回のGETで全体を取得する
+        return blob.download_as_bytes().decode('utf-8')
+
+    from google.cloud.storage import transfer_manager
+    # download_chunks_concurrently はファイルパスに書き込む仕様なので、一時ディレクトリ内のファイルに落としてから読み込む
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_path = pathlib.Path(tmp_dir) / 'download'
+        transfer_manager.download_chunks_concurrently(
+            blob,
+            str(tmp_path),
+            chunk_size=GCS_DOWNLOAD_CHUNK_SIZE,
+            worker_type=transfer_manager.THREAD,
+            max_workers=GCS_DOWNLOAD_MAX_WORKERS,
+        )
+        return tmp_path.read_bytes().decode('utf-8')
+
+
+def _open_blob_stream(strategy: 'StorageStrategy', blob_name: str) -> BinaryIO:
+    """
+    Opens a blob for streaming reads (blob.open('rb')), translating errors into the common storage exceptions.
+    BlobReader は読み進めるのに合わせて GCS_DOWNLOAD_CHUNK_SIZE ずつRange GETで取得するので、全体をメモリに載せずに処理を始められる。
+    """
+    blob = strategy.bucket.blob(blob_name)
+    try:
+        # BlobReaderは最初の読み込みまでリクエストを送らないので、存在確認と権限のエラーはここで先に出しておく
+        blob.reload()
+        return blob.open('rb', chunk_size=GCS_DOWNLOAD_CHUNK_SIZE)
+    except exceptions.NotFound as e:
+        raise StorageFileNotFoundError(f"File not found in GCS: gs://{strategy.bucket_name}/{blob_name}") from e
+    except exceptions.Forbidden as e:
+        raise StoragePermissionError(f"Permission denied to read from GCS path: gs://{strategy.bucket_name}/{blob_name}") from e
+    except exceptions.GoogleAPICallError as e:
+        raise StorageError(f"A GCS API error occurred while reading '{blob_name}': {e}") from e
+
+
+@contextmanager
+def _translate_local_read_errors(full_path: pathlib.Path):
+    """Translates OS-level errors raised while reading a local file into the common storage exceptions."""
+    try:
+        yield
+    except FileNotFoundError as e:
+        # FileNotFoundErrorを共通の例外に翻訳して再送出
+        raise StorageFileNotFoundError(f"Local file not found: {full_path}") from e
+    except PermissionError as e:
+        # PermissionErrorを共通の例外に翻訳して再送出
+        raise StoragePermissionError(f"Permission denied for local file: {full_path}") from e
+    except IsADirectoryError as e:
+        raise StorageError(f"Path is a directory, not a file: {full_path}") from e
+    except UnicodeDecodeError as e:
+        raise StorageError(f"Failed to decode file with UTF-8: {full_path}") from e
+    except OSError as e:
+        # その他のOS関連エラーをキャッチ
+        raise StorageError(f"An OS error occurred while reading file: {full_path}") from e
+
+
+def _write_all(fd: int, data: bytes | memoryview):
+    """
+    Writes all of data to the file descriptor.
+    os.write() は一度に全てを書き込むとは限らない(部分書き込み)ので、書き切るまでループする。
+    """
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+
+def _read_all(fd: int, size: int) -> bytes:
+    """
+    Reads size bytes from the file descriptor (fewer only if EOF comes first).
+    os.read() も要求したサイズより少なく返すことがある(ネットワークファイルシステムなど)ので、読み切るまでループする。
+    """
+    data = os.read(fd, size)
+    if len(data) == size:
+        return data
+    parts = [data]
+    remaining = size - len(data)
+    while remaining and (chunk := os.read(fd, remaining)):
+        parts.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(parts)
+
+
+def _copy_file_range_all(src_fd: int, dst_fd: int, size: int) -> bool:
+    """
+    Copies size bytes from src_fd to dst_fd with os.copy_file_range.
+    Returns False (without raising) if copy_file_range is unavailable for these files, so the caller can fall back.
+    """
+    if not hasattr(os, 'copy_file_range'):
+        return False
+    offset = 0
+    try:
+        while offset < size:
+            # 一度の呼び出しで全てがコピーされるとは限らないので、残りがなくなるまで繰り返す
+            copied = os.copy_file_range(src_fd, dst_fd, size - offset, offset, offset)
+            if copied == 0:
+                break
+            offset += copied
+    except OSError as e:
+        # カーネルやファイルシステムが対応していない場合(ENOSYS, EXDEV, EINVALなど)
+        if e.errno in (errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP, errno.EPERM):
+            return False
+        raise
+    return True
+
+
+@dataclass(slots=True, frozen=True)
+class PageMeta:
+    """Metadata stored alongside a page (used by the page-oriented strategies)."""
+    # 保存のたびに参照されるので、dictの .get() ではなく __slots__ の属性アクセスで取り出せるようにしている
+    category: str = ''
+
+
+# save() が受け付ける内容。str/StringIO はテキストとして、bytes/memoryview/BytesIO はUTF-8のバイト列として扱う。
+# SaveItem は save_many に渡す1件分の (内容, ファイル名, メタデータ)。
+SaveData = str | bytes | memoryview | io.StringIO | io.BytesIO
+SaveItem = tuple[SaveData, str, PageMeta | None]
+
 
 # --- Base Strategy Interface ---
 class StorageStrategy(ABC):
     @abstractmethod
-    def save(self, string_io: io.StringIO, filename: str, metadata: dict | None = None):
-        """Saves content from a string buffer to the storage."""
+    def save(self, data: SaveData, filename: str, metadata: PageMeta | None = None):
+        """Saves text (str/StringIO) or UTF-8 bytes (bytes/memoryview/BytesIO) to the storage."""
         pass
 
+    def save_bytes(self, buf: bytes | memoryview | io.BytesIO, filename: str, metadata: PageMeta | None = None):
+        """
+        Saves UTF-8 encoded content from bytes or a bytes buffer to the storage.
+        バイト列をそのまま書き込める戦略はこれをオーバーライドする。デフォルトではデコードして save() に渡す。
+        """
+        # memoryview には decode() が無いので、str() でデコードする(bytes/memoryview/BytesIOのバッファのどれでもコピーせずに読める)
+        data = buf.getbuffer() if isinstance(buf, io.BytesIO) else buf
+        self.save(str(data, 'utf-8'), filename, metadata)
+
+    def save_many(self, items: Iterable[SaveItem]):
+        """
+        Saves multiple (buffer, filename, metadata) items.
+        まとめて書き込める戦略(SQLiteなど)はこれをオーバーライドする。デフォルトでは1件ずつ save()/save_bytes() を呼ぶ。
+        """
+        for buf, filename, metadata in items:
+            self._save_item(buf, filename, metadata)
+
+    def _save_item(self, buf: SaveData, filename: str, metadata: PageMeta | None = None):
+        """Dispatches one save_many item to save_bytes() or save() depending on the buffer type."""
+        if isinstance(buf, (bytes, memoryview, io.BytesIO)):
+            self.save_bytes(buf, filename, metadata)
+        else:
+            self.save(buf, filename, metadata)
+
+    def save_rows(self, rows: Iterable[Sequence[str]], filename: str, header: Sequence[str] | None = None):
+        """
+        Saves the rows as a UTF-8 CSV file.
+        ファイルに直接書き出せる戦略(Localなど)はこれをオーバーライドする。デフォルトではメモリ上でCSVを組み立てて save_bytes() に渡す。
+        """
+        if header is not None:
+            rows = itertools.chain([header], rows)
+        self.save_bytes(convert_rows_to_in_memory_csv_bytes(rows), filename)
+
     @abstractmethod
-    def read(self, filename: str) -> io.StringIO:
-        """Reads content from the storage into a string buffer."""
+    def read(self, filename: str) -> str:
+        """Reads content from the storage and returns it as a string."""
         pass
 
+    def read_stream(self, filename: str) -> BinaryIO:
+        """
+        Opens the content as a binary file object of UTF-8 bytes. The caller closes it.
+        文字列が不要な呼び出し側(csv.reader に io.TextIOWrapper 経由で渡すなど)は、これで全体の文字列を作らずに少しずつ読める。
+        ストリームとして開ける戦略(Local/GCS)はこれをオーバーライドする。デフォルトでは read() の結果をエンコードして返す。
+        """
+        return io.BytesIO(self.read(filename).encode('utf-8'))
+
+    def iter_read(self, filename: str, chunk_size: int = READ_CHUNK_CHARS) -> Iterator[str]:
+        """
+        Yields the content in pieces of at most chunk_size characters.
+        少しずつ読み出せる戦略(Localなど)はこれをオーバーライドする。デフォルトでは read() の結果を分割して返す。
+        """
+        content = self.read(filename)
+        for start in range(0, len(content), chunk_size):
+            yield content[start:start + chunk_size]
+
     @abstractmethod
     def exists(self, filename: str) -> bool:
         """Checks if a file exists in the storage."""
@@ -48,25 +499,149 @@ class StorageStrategy(ABC):
         """
         pass
 
+    def get_storage_iterator_into(self, buf: list) -> Iterator[list]:
+        """
+        Like get_storage_iterator(), but overwrites buf[0:4] with (category, url, content, scraped_at)
+        in place and yields the same buf every time, instead of a new tuple per item.
+        呼び出し側は次の要素に進む前に、必要な値を取り出して(コピーして)おくこと。
+        """
+        buf[:] = (None, None, None, None)
+        for buf[0], buf[1], buf[2], buf[3] in self.get_storage_iterator():
+            yield buf
+
 # --- Concrete Strategy for Local Storage ---
 class LocalStorageStrategy(StorageStrategy):
     """Saves the content to a local file."""
     def __init__(self, local_storage_path: pathlib.Path):
         self.local_storage_path = local_storage_path
+        # 作成済みのディレクトリを覚えておき、保存のたびに mkdir(のstat/mkdirシステムコール)を繰り返さない
+        self._created_dirs: set[pathlib.Path] = set()
+        # exists() 用のディレクトリごとのエントリ名のキャッシュ。ディレクトリを最初に確認したときに os.scandir() で一度だけ読み込み、
+        # 以降はファイルごとの stat システムコールをせずに set で判定する。このインスタンス経由の保存では set にも追加する。
+        # 外部のプロセスなどがディレクトリを変更した場合は invalidate() を呼ぶ。
+        self._dir_cache: dict[pathlib.Path, set[str]] = {}
+        # save_many 用のスレッドプール。最初に使われた時に作り、close() で止める
+        self._executor: ThreadPoolExecutor | None = None
+        self._executor_lock = threading.Lock()
+
+    def save(self, data: SaveData, filename: str, metadata: PageMeta | None = None):
+        # 一度だけUTF-8にエンコードして、バイナリ書き込みの経路に任せる
+        self.save_bytes(_to_utf8_bytes(data), filename, metadata)
+
+    def save_bytes(self, buf: bytes | memoryview | io.BytesIO, filename: str, metadata: PageMeta | None = None):
+        # BytesIOの場合は getbuffer() で内部バッファのmemoryviewを取得し、コピーせずに書き込む
+        data = buf.getbuffer() if isinstance(buf, io.BytesIO) else buf
+
+        def write_to(tmp_path: pathlib.Path):
+            # 書き込むデータの全体がすでに手元にあるので、BufferedWriterを経由せず os.write() で直接書き込む
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                _write_all(fd, data)
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+        self._save_atomically(filename, write_to)
+
+    def save_many(self, items: Iterable[SaveItem]):
+        """
+        Writes multiple files in parallel on a thread pool.
+        os.write()/fsync() の間はGILが解放されるので、スレッドで並列に書き込むと、ファイルごとのシステムコールや
+        fsyncの待ち時間が重なり合い、小さなファイルを大量に書く場合にSSDの性能を使い切れる。
+        失敗した分は StorageBatchError としてまとめて送出する。
+        """
+        items = list(items)
+        # 親ディレクトリは、スレッドに渡す前にまとめて一度だけ作っておく
+        # (ここで失敗したディレクトリは、各ファイルの保存時にもう一度作成を試み、その項目のエラーとして報告される)
+        for parent in {(self.local_storage_path / filename).parent for _buf, filename, _metadata in items}:
+            try:
+                self._ensure_dir(parent)
+            except OSError:
+                pass
+        _save_many_concurrently(self, items, executor=self._get_executor())
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix='local-save')
+            return self._executor
+
+    def close(self):
+        """Shuts down the thread pool used by save_many."""
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
 
-    def save(self, string_io: io.StringIO, filename: str, metadata: dict | None = None):
+    def save_rows(self, rows: Iterable[Sequence[str]], filename: str, header: Sequence[str] | None = None):
+        """
+        Writes the rows as a CSV file directly, without building the whole CSV in memory first.
+        csv.writer(C実装)の出力を、1MiBのバッファを持つファイルにそのまま流し込む。
+        """
+        def write_to(tmp_path: pathlib.Path):
+            with open(tmp_path, 'w', encoding='utf-8', newline='', buffering=LOCAL_WRITE_BUFFER_SIZE) as f:
+                writer = csv.writer(f)
+                if header is not None:
+                    writer.writerow(header)
+                writer.writerows(rows)
+                f.flush()
+                os.fsync(f.fileno())
+
+        self._save_atomically(filename, write_to)
+
+    def copy(self, src_name: str, dst_name: str):
+        """
+        Copies a stored file to another name within this storage, atomically like save().
+        Linuxでは os.copy_file_range() でカーネル内でコピーし、データをユーザー空間に読み出さない(同一FSなら実質ゼロコピー)。
+        使えない環境やファイルシステムでは、1MiBずつの read()/write() にフォールバックする。
+        """
+        src_path = self.local_storage_path / src_name
+        with _translate_local_read_errors(src_path):
+            src = open(src_path, 'rb')
+        with src:
+            size = os.fstat(src.fileno()).st_size
+
+            def write_to(tmp_path: pathlib.Path):
+                with open(tmp_path, 'wb') as dst:
+                    src.seek(0)
+                    if not _copy_file_range_all(src.fileno(), dst.fileno(), size):
+                        src.seek(0)
+                        dst.seek(0)
+                        dst.truncate()
+                        shutil.copyfileobj(src, dst, LOCAL_WRITE_BUFFER_SIZE)
+                    dst.flush()
+                    os.fsync(dst.fileno())
+
+            self._save_atomically(dst_name, write_to)
+
+    def _save_atomically(self, filename: str, write_to: Callable[[pathlib.Path], None]):
+        """
+        Calls write_to(tmp_path) to write the whole content to a temporary file, then replaces the target with it.
+        write_to は一時ファイルに全てを書き込み、fsyncまで済ませる関数。
+        """
+        full_path = self.local_storage_path / filename
         try:
-            full_path = self.local_storage_path / filename
-            print(f"Using LocalStorageStrategy to save to: '{full_path}'")
+            logger.debug("Using LocalStorageStrategy to save to: '%s'", full_path)
 
-            full_path.parent.mkdir(parents=True, exist_ok=True)
+            self._ensure_dir(full_path.parent)
 
-            csv_content = string_io.getvalue()
+            # 途中でクラッシュしても途中までしか書かれていないファイルが残らないよう、同じディレクトリの一時ファイルに書き切って
+            # fsyncしてから os.replace() で置き換える。rename は同一ファイルシステム内ではアトミックなので、
+            # read() からは「古いファイル」か「書き終わったファイル」のどちらかしか見えない。
+            # save_many では複数のスレッドが同時に書き込むので、一時ファイル名にはスレッドIDも含めて衝突を避ける
+            tmp_path = full_path.with_name(f"{full_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            try:
+                write_to(tmp_path)
+                os.replace(tmp_path, full_path)
+            except BaseException:
+                # 失敗した場合は一時ファイルを残さない
+                tmp_path.unlink(missing_ok=True)
+                raise
 
-            with open(full_path, "w", newline="", encoding="utf-8") as f:
-                f.write(csv_content)
+            if (entries := self._dir_cache.get(full_path.parent)) is not None:
+                entries.add(full_path.name)
 
-            print(f"Successfully created '{full_path}'.")
+            logger.debug("Successfully created '%s'.", full_path)
 
         except PermissionError as e:
             # ディレクトリ作成やファイル書き込みの権限がない場合
@@ -81,48 +656,99 @@ class LocalStorageStrategy(StorageStrategy):
             # その他のOSレベルのI/Oエラーを捕捉
             raise StorageError(f"An OS error occurred while saving file: {full_path} ({e})") from e
 
+    def _ensure_dir(self, directory: pathlib.Path):
+        """Creates directory (and its parents) unless this instance has already done so."""
+        if directory in self._created_dirs:
+            return
+        directory.mkdir(parents=True, exist_ok=True)
+        self._created_dirs.add(directory)
+        # 新しく作られたかもしれないディレクトリを、親ディレクトリのexists()用キャッシュにも反映する
+        for path in (directory, *directory.parents):
+            if (entries := self._dir_cache.get(path.parent)) is not None:
+                entries.add(path.name)
+
+    def read(self, filename: str) -> str:
+        full_path = self.local_storage_path / filename
+        logger.debug("LocalStorage: Reading '%s'.", filename)
+        with _translate_local_read_errors(full_path):
+            # ファイルをメモリマップして、マップされた領域から直接UTF-8としてデコードする。
+            # read_bytes()だとファイル全体のbytesを一度ヒープに作ってからデコードするが、mmapならその中間コピーが不要で、
+            # ページはデコード時にOSが必要な分だけ読み込む。テキスト用のデコーダ(TextIOWrapper)も介さない。
+            # なお、改行コードの変換は行われないので、保存時の改行(CSVなら \r\n)がそのまま残るが、csvやjsonの読み込みには影響しない。
+            # StringIOで包まずに文字列のまま返す。ファイルオブジェクトが必要な呼び出し側だけが自分で包む。
+            fd = os.open(full_path, os.O_RDONLY)
+            try:
+                st = os.fstat(fd)
+                if stat.S_ISDIR(st.st_mode):
+                    # Linuxではディレクトリも O_RDONLY で開けてしまうので、ここで明示的に弾く
+                    raise IsADirectoryError(f"Is a directory: '{full_path}'")
+                if st.st_size < LOCAL_MMAP_THRESHOLD:
+                    # 小さいファイルは、fstatで分かっているサイズぶんを os.read() で読む(通常は一回で読み切れる)。
+                    # (open()+read()だと、EOFを確認するための余分なread呼び出しなどが発生する。サイズ0のファイルもここで扱う)
+                    return _read_all(fd, st.st_size).decode('utf-8')
+                with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mm:
+                    return str(mm, 'utf-8')
+            finally:
+                os.close(fd)
+
+    def read_stream(self, filename: str) -> BinaryIO:
+        full_path = self.local_storage_path / filename
+        logger.debug("LocalStorage: Opening '%s' as a stream.", filename)
+        with _translate_local_read_errors(full_path):
+            return open(full_path, 'rb', buffering=LOCAL_READ_BUFFER_SIZE)
 
-    def read(self, filename: str) -> io.StringIO:
+    def iter_read(self, filename: str, chunk_size: int = READ_CHUNK_CHARS) -> Iterator[str]:
         full_path = self.local_storage_path / filename
-        print(f"LocalStorage: Reading '{filename}'.")
-        try:
-            # full_pathはpathlib.Pathオブジェクトで、.read_text()はそのオブジェクトが持つ便利なメソッド
-            # .read_text()は、テキストファイルの中身を一度にすべて読み込み、1つの文字列として返すショートカットメソッド
-            # 内部的には open()を使っている。読み込めるファイル: .csv, .txt, .json, .py, .html など。。
-            # full_path.read_text() は、ファイルからテキストを読み込む際に、OSや元のファイルの改行コードの違いを吸収し、
-            # Pythonのプログラム内では原則として改行を \n (ラインフィード, LF) という単一の文字に統一して扱います。
-            # read_text() メソッドは、内部でファイルを開き、内容をすべて読み込んだ後、自動的にファイルをクローズします。
-            content = full_path.read_text(encoding='utf-8')
-            return io.StringIO(content)
-        except FileNotFoundError as e:
-            # FileNotFoundErrorを共通の例外に翻訳して再送出
-            raise StorageFileNotFoundError(f"Local file not found: {full_path}") from e
-        except PermissionError as e:
-            # PermissionErrorを共通の例外に翻訳して再送出
-            raise StoragePermissionError(f"Permission denied for local file: {full_path}") from e
-        except IsADirectoryError as e:
-            raise StorageError(f"Path is a directory, not a file: {full_path}") from e
-        except UnicodeDecodeError as e:
-            raise StorageError(f"Failed to decode file with UTF-8: {full_path}") from e
-        except OSError as e:
-            # その他のOS関連エラーをキャッチ
-            raise StorageError(f"An OS error occurred while reading file: {full_path}") from e
+        logger.debug("LocalStorage: Streaming '%s'.", filename)
+        with _translate_local_read_errors(full_path):
+            # ファイル全体を一つの文字列にせず、少しずつデコードしながら返す。
+            # テキストモード(TextIOWrapper、バッファ8KiB)ではなく、1MiBのバッファを持つバイナリモードで読み、
+            # インクリメンタルデコーダでUTF-8をデコードする(チャンクの境界で分断されたマルチバイト文字は次のチャンクに持ち越される)。
+            # read()と同じく改行コードの変換は行わない。chunk_size はバイト数として扱うので、返る文字列はそれ以下の長さになる。
+            decoder = codecs.getincrementaldecoder('utf-8')()
+            with open(full_path, 'rb', buffering=LOCAL_READ_BUFFER_SIZE) as f:
+                while data := f.read(chunk_size):
+                    if text := decoder.decode(data):
+                        yield text
+                decoder.decode(b'', final=True)
 
     def exists(self, filename: str) -> bool:
         try:
             full_path = self.local_storage_path / filename
-            return full_path.exists()
+            entries = self._dir_cache.get(full_path.parent)
+            if entries is None:
+                entries = self._dir_cache[full_path.parent] = self._scan_dir(full_path.parent)
+            return full_path.name in entries
         except PermissionError:
             # 権限エラーで確認できない場合は「存在しない」として扱うか、
             # もしくはログを出力するなど、アプリケーションの要件に応じて対応する。
             # ここではシンプルに False を返す例を示す。
-            print(f"Permission denied while checking existence of '{full_path}'.")
+            logger.warning("Permission denied while checking existence of '%s'.", full_path)
             return False
         except OSError as e:
             # その他のOSエラーが発生した場合も同様
-            print(f"An OS error occurred while checking existence: {e}")
+            logger.warning("An OS error occurred while checking existence: %s", e)
             return False
 
+    @staticmethod
+    def _scan_dir(directory: pathlib.Path) -> set[str]:
+        """Returns the names of all entries in directory (an empty set if it does not exist yet)."""
+        try:
+            with os.scandir(directory) as it:
+                return {entry.name for entry in it}
+        except FileNotFoundError:
+            return set()
+
+    def invalidate(self, directory: pathlib.Path | None = None):
+        """
+        Drops the cached listing used by exists() for directory (or for all directories if omitted).
+        Call this after files were added or removed outside of this strategy.
+        """
+        if directory is None:
+            self._dir_cache.clear()
+        else:
+            self._dir_cache.pop(pathlib.Path(directory), None)
+
     # ★インターフェースを実装するが、このクラスの責務ではないためNotImplementedErrorを発生させる
     def get_storage_iterator(self) -> Iterator[tuple]:
         raise NotImplementedError(
@@ -135,7 +761,7 @@ class LocalStorageStrategy(StorageStrategy):
 class GCSFileStorageStrategy(StorageStrategy):
     """Saves the content to a Google Cloud Storage bucket."""
 
-    def __init__(self, bucket_name: str, gcs_path_prefix: str):
+    def __init__(self, bucket_name: str, gcs_path_prefix: str, cache_control: str | None = None):
         """
         Initializes the GCS strategy with a bucket name and a path prefix.
         """
@@ -143,46 +769,61 @@ class GCSFileStorageStrategy(StorageStrategy):
             raise ValueError("GCS bucket name cannot be empty.")
 
         try:
-            self.client = storage.Client()
+            self.client = _get_gcs_client()
             self.bucket = self.client.bucket(bucket_name)
             self.bucket_name = bucket_name
             self.gcs_path_prefix = gcs_path_prefix
+            # GCSのオブジェクト名の区切りは常に '/'。os.path.join はWindowsでは '\' で連結してしまうので使わず、
+            # 末尾に '/' を付けたプレフィックスを一度だけ作っておき、呼び出しのたびに文字列連結するだけにする。
+            self._prefix = gcs_path_prefix.rstrip('/') + '/' if gcs_path_prefix else ''
+            self.cache_control = cache_control
+            # exists() 用のオブジェクト名のキャッシュ。最初の exists() で一覧して作り、save時に追加する
+            self._name_cache: set[str] | None = None
+            self._name_cache_lock = threading.Lock()
         except Exception as e:
             raise StorageError(
                 "Failed to initialize Google Cloud Storage client. "
                 "Ensure you are authenticated (e.g., via 'gcloud auth application-default login')."
             ) from e
 
-        print(f"Using GCSFileStorageStrategy. Target: 'gs://{self.bucket_name}/{self.gcs_path_prefix}'")
+        logger.info("Using GCSFileStorageStrategy. Target: 'gs://%s/%s'", self.bucket_name, self.gcs_path_prefix)
 
 
-    def save(self, string_io: io.StringIO, filename: str, metadata: dict | None = None):
-        """Uploads the content of the string buffer to a GCS blob."""
-        blob_name = os.path.join(self.gcs_path_prefix, filename)
-        blob = self.bucket.blob(blob_name)
+
+    def save(self, data: SaveData, filename: str, metadata: PageMeta | None = None):
+        """Uploads the content to a GCS blob (text is encoded to UTF-8 once; bytes are uploaded as they are)."""
+        self.save_bytes(_to_utf8_bytes(data), filename, metadata)
+
+    def save_bytes(self, buf: bytes | memoryview | io.BytesIO, filename: str, metadata: PageMeta | None = None):
+        """Uploads UTF-8 encoded bytes to a GCS blob without re-encoding them."""
+        blob_name = self._prefix + filename
+        blob = _upload_bucket(self).blob(blob_name)
         try:
-            csv_content = string_io.getvalue()
             # content_type は、もともとHTTP通信で使われるMIMEタイプという規格に準拠しています。
             # これをつけない場合、GCSはファイルの種類を推測できず、application/octet-stream（種類不明のバイナリデータ）や
             # text/plain（ただのテキスト）といった汎用的なタイプを自動的に割り当ててしまいます。
             # その結果、ブラウザでファイルを開いたときに、意図せずテキストがそのまま表示されてしまったりする。
-            blob.upload_from_string(csv_content, content_type='text/csv')
-            print(f"Successfully uploaded '{filename}' to 'gs://{self.bucket_name}/{blob_name}'.")
+            # 中身はUTF-8にエンコード済みのバイト列なので、charsetも明示する(指定がないと、読み手によってはLatin-1などとして解釈される)。
+            _upload_bytes(blob, buf, content_type='text/csv; charset=utf-8', cache_control=self.cache_control)
+            logger.debug("Successfully uploaded '%s' to 'gs://%s/%s'.", filename, self.bucket_name, blob_name)
+            if (names := self._name_cache) is not None:
+                names.add(blob_name)
         except exceptions.Forbidden as e:
             raise StoragePermissionError(f"Permission denied to write to GCS path: gs://{self.bucket_name}/{blob_name}") from e
         except exceptions.GoogleAPICallError as e:
             raise StorageError(f"A GCS API error occurred while saving '{blob_name}': {e}") from e
 
-    def read(self, filename: str) -> io.StringIO:
-        """Downloads a blob from GCS and returns its content as a string buffer."""
-        blob_name = os.path.join(self.gcs_path_prefix, filename)
+    def save_many(self, items: Iterable[SaveItem]):
+        """Uploads multiple files to GCS in parallel."""
+        _save_many_concurrently(self, items)
+
+    def read(self, filename: str) -> str:
+        """Downloads a blob from GCS and returns its content as a string."""
+        blob_name = self._prefix + filename
         blob = self.bucket.blob(blob_name)
-        print(f"GCSFileStorage: Reading 'gs://{self.bucket_name}/{blob_name}'.")
+        logger.debug("GCSFileStorage: Reading 'gs://%s/%s'.", self.bucket_name, blob_name)
         try:
-            content_str = blob.download_as_text(encoding='utf-8')
-            # content_bytes = blob.download_as_bytes()
-            # content_str = content_bytes.decode('utf-8')
-            return io.StringIO(content_str)
+            return _download_text(blob)
         except exceptions.NotFound as e:
             raise StorageFileNotFoundError(f"File not found in GCS: gs://{self.bucket_name}/{blob_name}") from e
         except exceptions.Forbidden as e:
@@ -190,20 +831,32 @@ class GCSFileStorageStrategy(StorageStrategy):
         except exceptions.GoogleAPICallError as e:
             raise StorageError(f"A GCS API error occurred while reading '{blob_name}': {e}") from e
 
+    def read_stream(self, filename: str) -> BinaryIO:
+        """Opens a blob as a streaming binary file object (downloaded in chunks as it is read)."""
+        blob_name = self._prefix + filename
+        logger.debug("GCSFileStorage: Opening 'gs://%s/%s' as a stream.", self.bucket_name, blob_name)
+        return _open_blob_stream(self, blob_name)
+
     def exists(self, filename: str) -> bool:
-        """Checks if a blob exists in the GCS bucket."""
-        blob_name = os.path.join(self.gcs_path_prefix, filename)
-        blob = self.bucket.blob(blob_name)
-        print(f"GCSFileStorage: Checking existence of 'gs://{self.bucket_name}/{blob_name}'.")
+        """Checks if a blob exists in the GCS bucket, using the cached listing of blob names."""
+        blob_name = self._prefix + filename
+        logger.debug("GCSFileStorage: Checking existence of 'gs://%s/%s'.", self.bucket_name, blob_name)
         try:
-            return blob.exists()
+            return blob_name in _cached_blob_names(self)
         except exceptions.Forbidden as e:
-            print(f"Permission denied while checking existence of GCS object '{blob_name}': {e}")
+            logger.warning("Permission denied while checking existence of GCS object '%s': %s", blob_name, e)
             return False
         except exceptions.GoogleAPICallError as e:
-            print(f"A GCS API error occurred while checking existence of '{blob_name}': {e}")
+            logger.warning("A GCS API error occurred while checking existence of '%s': %s", blob_name, e)
             return False
 
+    def invalidate(self):
+        """
+        Drops the cached listing used by exists(); the next exists() lists the prefix again.
+        Call this after blobs were added or removed outside of this strategy.
+        """
+        self._name_cache = None
+
 
     def get_storage_iterator(self) -> Iterator[tuple]:
         raise NotImplementedError(
@@ -217,27 +870,37 @@ class GCSPageStorageStrategy(StorageStrategy):
     It behaves like a database, storing content with custom metadata.
     """
 
-    def __init__(self, bucket_name: str, gcs_path_prefix: str):
+    def __init__(self, bucket_name: str, gcs_path_prefix: str, cache_control: str | None = None):
         if not bucket_name:
             raise ValueError("GCS bucket name cannot be empty.")
         try:
-            self.client = storage.Client()
+            self.client = _get_gcs_client()
             self.bucket = self.client.bucket(bucket_name)
             self.bucket_name = bucket_name
             self.gcs_path_prefix = gcs_path_prefix
+            # GCSFileStorageStrategy と同じく、'/' 区切りのプレフィックスを一度だけ作っておく
+            self._prefix = gcs_path_prefix.rstrip('/') + '/' if gcs_path_prefix else ''
+            self.cache_control = cache_control
+            # exists() 用のオブジェクト名のキャッシュ。最初の exists() で一覧して作り、save時に追加する
+            self._name_cache: set[str] | None = None
+            self._name_cache_lock = threading.Lock()
         except Exception as e:
             raise StorageError("Failed to initialize GCS client.") from e
-        print(f"Using GCSPageStorageStrategy. Target: 'gs://{self.bucket_name}/{self.gcs_path_prefix}'")
+        logger.info("Using GCSPageStorageStrategy. Target: 'gs://%s/%s'", self.bucket_name, self.gcs_path_prefix)
+
+
+    def save(self, data: SaveData, filename: str, metadata: PageMeta | None = None):
+        self.save_bytes(_to_utf8_bytes(data), filename, metadata)
 
-    def save(self, string_io: io.StringIO, filename: str, metadata: dict | None = None):
+    def save_bytes(self, buf: bytes | memoryview | io.BytesIO, filename: str, metadata: PageMeta | None = None):
         """
         Uploads content to a GCS blob, storing category and scraped_at
         as custom metadata.
         """
-        blob_name = os.path.join(self.gcs_path_prefix, filename)
-        blob = self.bucket.blob(blob_name)
+        blob_name = self._prefix + filename
+        blob = _upload_bucket(self).blob(blob_name)
 
-        category = metadata.get('category', 'default') if metadata else 'default'
+        category = metadata.category if metadata else 'default'
         scraped_at = datetime.now(timezone.utc).isoformat()
 
         blob.metadata = {
@@ -246,22 +909,26 @@ class GCSPageStorageStrategy(StorageStrategy):
         }
 
         try:
-            content = string_io.getvalue()
-            # HTMLを想定するため content_type を text/html にする
-            blob.upload_from_string(content, content_type='text/html')
-            print(f"Successfully uploaded page '{filename}' to 'gs://{self.bucket_name}/{blob_name}' with metadata.")
+            # HTMLを想定するため content_type を text/html にする(UTF-8のバイト列なので charset も付ける)
+            _upload_bytes(blob, buf, content_type='text/html; charset=utf-8', cache_control=self.cache_control)
+            logger.debug("Successfully uploaded page '%s' to 'gs://%s/%s' with metadata.", filename, self.bucket_name, blob_name)
+            if (names := self._name_cache) is not None:
+                names.add(blob_name)
         except exceptions.Forbidden as e:
             raise StoragePermissionError(f"Permission denied to write to GCS path: gs://{self.bucket_name}/{blob_name}") from e
         except exceptions.GoogleAPICallError as e:
             raise StorageError(f"A GCS API error occurred while saving '{blob_name}': {e}") from e
 
-    def read(self, filename: str) -> io.StringIO:
+    def save_many(self, items: Iterable[SaveItem]):
+        """Uploads multiple pages to GCS in parallel."""
+        _save_many_concurrently(self, items)
+
+    def read(self, filename: str) -> str:
         """Downloads a blob from GCS and returns its content."""
-        blob_name = os.path.join(self.gcs_path_prefix, filename)
+        blob_name = self._prefix + filename
         blob = self.bucket.blob(blob_name)
         try:
-            content_str = blob.download_as_text(encoding='utf-8')
-            return io.StringIO(content_str)
+            return _download_text(blob)
         except exceptions.NotFound as e:
             raise StorageFileNotFoundError(f"File not found in GCS: gs://{self.bucket_name}/{blob_name}") from e
         except exceptions.Forbidden as e:
@@ -269,77 +936,238 @@ class GCSPageStorageStrategy(StorageStrategy):
         except exceptions.GoogleAPICallError as e:
             raise StorageError(f"A GCS API error occurred while reading '{blob_name}': {e}") from e
 
+    def read_stream(self, filename: str) -> BinaryIO:
+        """Opens a blob as a streaming binary file object."""
+        return _open_blob_stream(self, self._prefix + filename)
+
     def exists(self, filename: str) -> bool:
-        """Checks if a blob exists in the GCS bucket."""
-        blob_name = os.path.join(self.gcs_path_prefix, filename)
-        blob = self.bucket.blob(blob_name)
+        """Checks if a blob exists in the GCS bucket, using the cached listing of blob names."""
+        blob_name = self._prefix + filename
         try:
-            return blob.exists()
+            return blob_name in _cached_blob_names(self)
         except exceptions.Forbidden as e:
-            print(f"Permission denied while checking existence of GCS object '{blob_name}': {e}")
+            logger.warning("Permission denied while checking existence of GCS object '%s': %s", blob_name, e)
             return False
         except exceptions.GoogleAPICallError as e:
-            print(f"A GCS API error occurred while checking existence of '{blob_name}': {e}")
+            logger.warning("A GCS API error occurred while checking existence of '%s': %s", blob_name, e)
             return False
 
+    def invalidate(self):
+        """Drops the cached listing used by exists() (see GCSFileStorageStrategy.invalidate)."""
+        self._name_cache = None
+
+    def _fetch_page(self, blob) -> tuple | None:
+        """Downloads one page blob and returns (category, url, content, scraped_at), or None if it failed."""
+        try:
+            # メタデータを先に取得（なければ空の辞書）
+            metadata = blob.metadata or {}
+            category = metadata.get('category', 'unknown') # メタデータがない場合へのフォールバック
+            # os.path.relpath はパスを正規化するので、URL中の '//' が '/' に潰れてしまう。プレフィックスを取り除くだけにする。
+            reference_url = blob.name.removeprefix(self._prefix)
+            # list_blobs で取得したblobはサイズを持っているので、大きなページは並列ダウンロードになる
+            content = _download_text(blob)
+            scraped_at = metadata.get('scraped_at', blob.updated.isoformat()) # メタデータ優先
+            return (category, reference_url, content, scraped_at)
+        except exceptions.GoogleAPICallError as e:
+            logger.warning("Failed to download or process blob 'gs://%s/%s': %s", self.bucket_name, blob.name, e)
+            return None
+
     def get_storage_iterator(self) -> Iterator[tuple]:
         """
         Streams all stored pages from GCS memory-efficiently.
         Reads category and scraped_at from custom metadata.
+        ダウンロードは GCS_ITERATOR_MAX_WORKERS 本のスレッドで並列に行い、ダウンロードが終わった順に返す(一覧の順序は保たない)。
+        先読みは最大 GCS_ITERATOR_PREFETCH 件までに抑え、手元に溜まるページでメモリを使いすぎないようにする。
         """
-        print(f"GCSPageStorage: Streaming pages from 'gs://{self.bucket_name}/{self.gcs_path_prefix}'...")
+        logger.info("GCSPageStorage: Streaming pages from 'gs://%s/%s'...", self.bucket_name, self.gcs_path_prefix)
+        executor = ThreadPoolExecutor(max_workers=GCS_ITERATOR_MAX_WORKERS, thread_name_prefix='gcs-iter')
+        in_flight = set()
         try:
-            for blob in self.bucket.list_blobs(prefix=self.gcs_path_prefix):
+            # 末尾の '/' まで含めて絞り込むので、'pages' と同じ文字で始まる別のディレクトリ(例: 'pages_old')は含まれない
+            for blob in self.bucket.list_blobs(prefix=self._prefix):
                 if blob.name.endswith('/'):
                     continue
+                in_flight.add(executor.submit(self._fetch_page, blob))
 
-                try:
-                    # メタデータを先に取得（なければ空の辞書）
-                    metadata = blob.metadata or {}
-                    category = metadata.get('category', 'unknown') # メタデータがない場合へのフォールバック
-                    reference_url = os.path.relpath(blob.name, self.gcs_path_prefix)
-                    content = blob.download_as_text(encoding='utf-8')
-                    scraped_at = metadata.get('scraped_at', blob.updated.isoformat()) # メタデータ優先
-
-                    yield (category, reference_url, content, scraped_at)
+                # 先読みの上限に達したら、どれかが終わるまで待って、終わった分を返してから次を投入する
+                if len(in_flight) >= GCS_ITERATOR_PREFETCH:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        if (page := future.result()) is not None:
+                            yield page
 
-                except exceptions.GoogleAPICallError as e:
-                    print(f"Warning: Failed to download or process blob 'gs://{self.bucket_name}/{blob.name}': {e}")
-                    continue
+            for future in as_completed(in_flight):
+                if (page := future.result()) is not None:
+                    yield page
+            in_flight = set()
 
         except exceptions.Forbidden as e:
             raise StoragePermissionError(f"Permission denied to list GCS path: gs://{self.bucket_name}/{self.gcs_path_prefix}") from e
         except exceptions.GoogleAPICallError as e:
             raise StorageError(f"A GCS API error occurred while listing blobs: {e}") from e
+        finally:
+            # 途中でイテレーションが止められた場合は、まだ始まっていないダウンロードを取り消す
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+# 接続ごとにキャッシュするコンパイル済みSQL文の数(sqlite3のデフォルトは128)
+SQLITE_CACHED_STATEMENTS = 256
+# get_storage_iterator で一度に fetchmany() する行数
+SQLITE_FETCH_ARRAYSIZE = 1000
+
+# 接続を開くたびに設定するPRAGMA。get_storage_strategy(sqlite_pragmas=...) で個別に上書きできる。
+# journal_mode=WAL + synchronous=NORMAL により、コミットのたびに発生していたfsyncがチェックポイント時だけになり、
+# 読み込み(get_storage_iterator)が書き込みをブロックしなくなる。WALモードはDBファイルに記録されるので、以降の接続にも引き継がれる。
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'temp_store': 'MEMORY',
+    'cache_size': -65536,  # 負の値はKiB単位。64MiB
+    'busy_timeout': 5000,  # ロック中でもすぐにエラーにせず、最大5秒待つ(ミリ秒)
+    'foreign_keys': 'ON',
+    'mmap_size': 256 * 1024 * 1024,  # DBファイルの先頭256MiBまでをmmapで読み、ページごとのread()システムコールを省く
+    # WALからDBファイルへの書き戻し(チェックポイント)を、デフォルトの1000ページごとより大きくまとめて行い、書き戻しの回数を減らす
+    'wal_autocheckpoint': 4096,  # ページ数(4KiBページで16MiB)
+    # チェックポイント後にWALファイルをこのサイズまで切り詰め、大量書き込みの後にWALがディスクとページキャッシュを占有し続けないようにする
+    'journal_size_limit': 64 * 1024 * 1024,
+}
+
+
+def _url_hash(url: str) -> int:
+    """
+    Returns a signed 64-bit hash of the URL, used as the lookup key in SQLite.
+    SQLiteのINTEGERは符号付き64bitなので、8バイトのダイジェストを符号付き整数として解釈する。
+    """
+    return int.from_bytes(hashlib.blake2b(url.encode('utf-8'), digest_size=8).digest(), 'big', signed=True)
+
+
+def _configure_pragmas(conn: sqlite3.Connection, pragmas: dict):
+    """Applies the given PRAGMA settings to a freshly opened connection."""
+    for name, value in pragmas.items():
+        conn.execute(f"PRAGMA {name}={value}")
 
 
 class SQLiteStorageStrategy(StorageStrategy):
     """Saves and reads content to/from a local SQLite database."""
-    def __init__(self, db_path: pathlib.Path):
+
+    # このクラスが発行するSQL文。sqlite3は接続ごとにSQL文字列をキーにしてコンパイル済みの文をキャッシュするので、
+    # 毎回同じ文字列オブジェクトを渡すことで、呼び出しのたびのパースが省かれる。
+    # reference_urlがUNIQUE制約を持つため、ON CONFLICTでUPDATEする
+    # ON CONFLICT構文を使うことにより、一つのSQLクエリでアトミックに upseart 作業が行える。
+    # CURRENT_TIMESTAMP はSQLite側で実行される関数であり、UTC（協定世界時）で日時を保存します。
+    # SQLite自体には専用の日時型がなく、TIMESTAMPとしてテーブルを定義しても、文字列として扱います。
+    # 再スクレイプ時は INSERT OR REPLACE を使わない。REPLACE は既存行をDELETEしてからINSERTするため、
+    # id(rowid)が振り直され、B-treeの書き込みも倍になる。ON CONFLICT DO UPDATE なら既存行をその場で更新する。
+    # URLの検索・重複判定は、URL文字列そのものではなくURLの64bitハッシュ(url_hash)の索引で行う。
+    # 可変長のTEXTの索引より索引が小さく、比較も整数比較になる。万一のハッシュ衝突に備え、読み込み時はURL自体も照合する。
+    # 再スクレイプでHTMLが変わっていない場合(content_hashが同じ)は、contentに元の値をそのまま代入する。
+    # SQLiteは同じサイズのレコードを上書きする際、内容が変わらないページは書き込まないので、
+    # contentのオーバーフローページはWALに書かれず、scraped_at などを含むページだけが更新される。
+    _SAVE_SQL = """
+    INSERT INTO scraped_pages (url_hash, reference_url, category, content, content_encoding, content_hash, scraped_at)
+    VALUES (?, ?, ?, ?, 'zstd', ?, CURRENT_TIMESTAMP)
+    ON CONFLICT(url_hash) DO UPDATE SET
+        category=excluded.category,
+        content=CASE WHEN content_hash IS excluded.content_hash THEN content ELSE excluded.content END,
+        content_encoding=excluded.content_encoding,
+        content_hash=excluded.content_hash,
+        scraped_at=excluded.scraped_at;
+    """
+    _READ_SQL = "SELECT content, content_encoding FROM scraped_pages WHERE url_hash = ? AND reference_url = ?;"
+    _SELECT_ALL_URLS_SQL = "SELECT reference_url FROM scraped_pages;"
+    _STREAM_PAGES_SQL = "SELECT category, reference_url, content, content_encoding, scraped_at FROM scraped_pages ORDER BY id"
+    # contentを除いた列だけを持つカバリングインデックス。ヘッダだけを読む場合、HTML本体を含むテーブルのページを読まずに済む。
+    _CREATE_HEADER_INDEX_SQL = (
+        "CREATE INDEX IF NOT EXISTS idx_scraped_pages_header "
+        "ON scraped_pages(id, category, reference_url, scraped_at);"
+    )
+    # カテゴリでの絞り込み用
+    _CREATE_CATEGORY_INDEX_SQL = "CREATE INDEX IF NOT EXISTS idx_scraped_pages_category ON scraped_pages(category);"
+    _STREAM_HEADERS_SQL = "SELECT id, category, reference_url, scraped_at FROM scraped_pages ORDER BY id"
+    _FETCH_CONTENT_SQL = "SELECT content, content_encoding FROM scraped_pages WHERE id = ?;"
+    # スキーマを変更したら上げる。DBファイルの PRAGMA user_version がこの値と一致していれば、テーブル作成やマイグレーションを省く。
+    _SCHEMA_VERSION = 3
+
+    def __init__(self, db_path: pathlib.Path, pragmas: dict | None = None):
         self.db_path = db_path
+        self._pragmas = {**SQLITE_PRAGMAS, **(pragmas or {})}
         self._conn = None
         try:
-            # parents=Trueの場合、途中の親ディレクトリが存在しなくても、再帰的にすべての親ディレクトリを作成します。
-            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            db_exists = self.db_path.exists()
+            if not db_exists:
+                # parents=Trueの場合、途中の親ディレクトリが存在しなくても、再帰的にすべての親ディレクトリを作成します。
+                self.db_path.parent.mkdir(parents=True, exist_ok=True)
             # self.db_pathにファイルがまだ存在しない場合は、この時点で新しく作成される
             # check_same_thread=False を設定すると、複数のスレッドから同じデータベース接続を共有できるようになる。
             # この場合、開発者自身がスレッドセーフティ（排他制御など）を考慮する必要がある。
-            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
-            self._create_table()
+            self._conn = sqlite3.connect(
+                self.db_path, check_same_thread=False, cached_statements=SQLITE_CACHED_STATEMENTS
+            )
+            _configure_pragmas(self._conn, self._pragmas)
+            # 既存のDBでスキーマが最新であれば、CREATE TABLE/マイグレーションとそのコミットを省く
+            if not (db_exists and self._schema_version() == self._SCHEMA_VERSION):
+                self._create_table()
+            # 書き込み用の接続は self._conn の1本だけ(SQLiteの書き込みは常に直列)。self._conn と self._save_cur はこのロックを持っている間だけ使う。
+            self._write_lock = threading.Lock()
+            # 読み込み用は読み取り専用(mode=ro)の接続を、スレッドごとに1本ずつ必要になった時点で開く(threading.local)。接続を共有すると、その接続のミューテックスを
+            # 取り合うことになるが、スレッドごとに別の接続ならWALのもとで読み込みがスレッド数に応じて並行に進む。
+            self._read_local = threading.local()
+            self._read_conns: list[sqlite3.Connection] = []
+            self._read_conns_lock = threading.Lock()
+            # save/read/exists はスクレイピング中に何度も呼ばれるホットパスなので、
+            # 呼び出しのたびにカーソルを作って捨てるのではなく、用途ごとのカーソルを一つずつ使い回す。
+            # (コンパイル済みのSQL文自体は、sqlite3モジュールがSQL文字列をキーにキャッシュしている)
+            self._save_cur = self._conn.cursor()
+            # exists() はURLごとに呼ばれるので、保存済みURLを起動時に一度だけ読み込んでsetで持っておき、
+            # SQLiteへの問い合わせをせずにO(1)で判定する。save時にsetにも追加して整合性を保つ。
+            self._url_set: set[str] = set()
+            url_cur = self._conn.execute(self._SELECT_ALL_URLS_SQL)
+            url_cur.arraysize = SQLITE_FETCH_ARRAYSIZE
+            # イテレータと同じく、1行ずつではなく SQLITE_FETCH_ARRAYSIZE 行ずつ取り出す
+            while rows := url_cur.fetchmany():
+                self._url_set.update(url for (url,) in rows)
+            # HTMLはzstdで圧縮してBLOBとして保存する(HTMLは数分の一に縮むので、DBファイルとページキャッシュの読み書き量が減る)。
+            # 圧縮/展開オブジェクトは再利用できるので使い回す。ただしスレッドセーフではないので、スレッドごとに持つ。
+            self._thread_local = threading.local()
         except sqlite3.OperationalError as e:
             raise StoragePermissionError(f"Could not connect to or create database at '{self.db_path}': {e}") from e
         except OSError as e:
             raise StoragePermissionError(f"Could not create directory for database at '{self.db_path.parent}': {e}") from e
 
+    def _read_conn(self) -> sqlite3.Connection:
+        """Returns the calling thread's read-only connection, opening it on first use."""
+        conn = getattr(self._read_local, 'conn', None)
+        if conn is None:
+            conn = self._read_local.conn = self._connect_read_only()
+            with self._read_conns_lock:
+                self._read_conns.append(conn)
+        return conn
+
+    def _connect_read_only(self) -> sqlite3.Connection:
+        """Opens a read-only connection to the database for one reader thread."""
+        conn = sqlite3.connect(
+            f"{self.db_path.resolve().as_uri()}?mode=ro",
+            uri=True,
+            check_same_thread=False,
+            cached_statements=SQLITE_CACHED_STATEMENTS,
+        )
+        # journal_modeの変更は書き込みになるので、読み取り専用の接続では設定しない(WALはDBファイルに記録済み)
+        _configure_pragmas(conn, {name: value for name, value in self._pragmas.items() if name != 'journal_mode'})
+        return conn
+
     def _create_table(self):
         """Ensures the table exists with the required schema."""
         # ★ご要望のスキーマ + scraped_at に更新
+        # idは挿入順を保つための主キーとして残し、URLの一意性は url_hash のUNIQUE索引で担保する。
         create_table_sql = """
         CREATE TABLE IF NOT EXISTS scraped_pages (
             id INTEGER PRIMARY KEY,
+            url_hash INTEGER UNIQUE NOT NULL,
             category TEXT,
-            reference_url TEXT UNIQUE NOT NULL,
-            content TEXT,
+            reference_url TEXT NOT NULL,
+            content BLOB,
+            content_encoding TEXT DEFAULT 'zstd',
+            content_hash BLOB,
             scraped_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL
         );
         """
@@ -348,76 +1176,207 @@ class SQLiteStorageStrategy(StorageStrategy):
             # そして、一般的にはSQLを実行する処理の都度、新しくカーソルを取得し、使い捨てる
             cursor = self._conn.cursor()
             cursor.execute(create_table_sql)
+            self._migrate_schema(cursor)
+            cursor.execute(self._CREATE_HEADER_INDEX_SQL)
+            cursor.execute(self._CREATE_CATEGORY_INDEX_SQL)
+            # PRAGMAはパラメータを受け付けないので値を直接埋め込む(クラス定数の整数なので安全)
+            cursor.execute(f"PRAGMA user_version = {self._SCHEMA_VERSION};")
             self._conn.commit()
         except sqlite3.Error as e:
             raise StorageError(f"Failed to create table in database '{self.db_path}': {e}") from e
 
-    def save(self, string_io: io.StringIO, filename: str, metadata: dict | None = None):
+    def _schema_version(self) -> int:
+        """Returns the schema version recorded in the database file (PRAGMA user_version)."""
+        return self._conn.execute("PRAGMA user_version;").fetchone()[0]
+
+    def _compress(self, buf: SaveData) -> tuple[bytes, bytes]:
+        """
+        Encodes the HTML as UTF-8 (if needed) and compresses it with zstd for storage.
+        Returns (compressed content, content hash). ハッシュは圧縮前のUTF-8バイト列に対して計算する。
+        StringIOの場合は、getvalue()でHTML全体の文字列やそのUTF-8のバイト列を丸ごと作らず、一定の文字数ずつ読み出して圧縮器に流し込む。
+        メモリ上に全体として残るのは、元の数分の一になった圧縮後のバイト列だけになる。
+        """
+        hasher = hashlib.blake2b(digest_size=CONTENT_HASH_SIZE)
+        compressor = getattr(self._thread_local, 'compressor', None)
+        if compressor is None:
+            compressor = self._thread_local.compressor = zstandard.ZstdCompressor(level=SQLITE_ZSTD_LEVEL)
+
+        if isinstance(buf, str):
+            buf = buf.encode('utf-8')
+        elif isinstance(buf, io.BytesIO):
+            buf = buf.getbuffer()
+        if isinstance(buf, (bytes, memoryview)):
+            # すでにUTF-8のバイト列なので、エンコードもコピーもせずにそのまま圧縮する
+            hasher.update(buf)
+            return compressor.compress(buf), hasher.digest()
+        string_io = buf
+
+        # getvalue()と同じく、読み出し位置に関係なく先頭から全体を対象にする
+        string_io.seek(0)
+        compress_obj = compressor.compressobj()
+        compressed_parts = []
+        while chunk := string_io.read(ENCODE_CHUNK_CHARS):
+            encoded = chunk.encode('utf-8')
+            hasher.update(encoded)
+            compressed_parts.append(compress_obj.compress(encoded))
+        compressed_parts.append(compress_obj.flush())
+        return b''.join(compressed_parts), hasher.digest()
+
+    def _decompressor(self) -> zstandard.ZstdDecompressor:
+        """Returns the calling thread's reusable zstd decompressor."""
+        decompressor = getattr(self._thread_local, 'decompressor', None)
+        if decompressor is None:
+            decompressor = self._thread_local.decompressor = zstandard.ZstdDecompressor()
+        return decompressor
+
+    def _decompress(self, content: bytes | str | None, encoding: str | None, errors: str = 'strict') -> str | None:
+        """
+        Restores the HTML string from a stored value, according to its content_encoding.
+        圧縮を導入する前に作られたDBでは content がTEXTのまま入っている(content_encoding は NULL)ので、その場合はそのまま返す。
+        """
+        if encoding == 'zstd':
+            # ストリーミングで圧縮したフレームにはヘッダに元のサイズが入っていないので、decompress()ではなく decompressobj() で展開する
+            return self._decompressor().decompressobj().decompress(content).decode('utf-8', errors=errors)
+        if isinstance(content, bytes):
+            return content.decode('utf-8', errors=errors)
+        return content
+
+    def _migrate_schema(self, cursor: sqlite3.Cursor):
+        """
+        Adds the columns introduced after the table was first created, on databases created before they existed.
+        古いDBでは reference_url のUNIQUE制約はそのまま残る(制約の削除にはテーブルの作り直しが必要なため)が、動作には影響しない。
+        """
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(scraped_pages)")}
+        if 'content_hash' not in columns:
+            # 既存の行はNULLのままで、次に保存された時に内容が書き換えられ、ハッシュが設定される
+            cursor.execute("ALTER TABLE scraped_pages ADD COLUMN content_hash BLOB")
+        if 'content_encoding' not in columns:
+            # DEFAULT 'zstd' を付けて追加すると、圧縮導入前のTEXTの行まで 'zstd' 扱いになってしまうので、
+            # NULL(=無圧縮)で追加してから、BLOBとして保存済みの(=圧縮済みの)行にだけ 'zstd' を設定する
+            cursor.execute("ALTER TABLE scraped_pages ADD COLUMN content_encoding TEXT")
+            cursor.execute("UPDATE scraped_pages SET content_encoding = 'zstd' WHERE typeof(content) = 'blob'")
+        if 'url_hash' in columns:
+            return
+        logger.info("SQLiteStorage: Adding url_hash column to existing database '%s'...", self.db_path)
+        cursor.execute("ALTER TABLE scraped_pages ADD COLUMN url_hash INTEGER")
+        self._conn.create_function('url_hash', 1, _url_hash, deterministic=True)
+        cursor.execute("UPDATE scraped_pages SET url_hash = url_hash(reference_url)")
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_scraped_pages_url_hash ON scraped_pages(url_hash)")
+
+    def save(self, data: SaveData, filename: str, metadata: PageMeta | None = None):
         """
         Saves content to the database.
-        Uses 'filename' as the URL and extracts 'category' from metadata.
+        Uses 'filename' as the URL and takes the category from metadata.
         If the URL already exists, it updates the existing record.
         """
-        html_content = string_io.getvalue()
-        url = filename
-        category = metadata.get('category', '') if metadata else ''
-
-        # reference_urlがUNIQUE制約を持つため、ON CONFLICTでUPDATEする
-        # ON CONFLICT構文を使うことにより、一つのSQLクエリでアトミックに upseart 作業が行える。　
-        # CURRENT_TIMESTAMP はSQLite側で実行される関数であり、UTC（協定世界時）で日時を保存します。
-        # SQLite自体には専用の日時型がなく、TIMESTAMPとしてテーブルを定義しても、文字列として扱います。
-        sql = """
-        INSERT INTO scraped_pages (reference_url, category, content, scraped_at)
-        VALUES (?, ?, ?, CURRENT_TIMESTAMP)
-        ON CONFLICT(reference_url) DO UPDATE SET
-            category=excluded.category,
-            content=excluded.content,
-            scraped_at=excluded.scraped_at;
-        """
-        try:
-            print(f"Using SQLiteStorageStrategy to save URL: '{url}' with category: '{category}'")
-            cursor = self._conn.cursor()
-            cursor.execute(sql, (url, category, html_content))
-            self._conn.commit()
-            print(f"Successfully saved/updated '{url}' in '{self.db_path}'.")
-        except sqlite3.Error as e:
-            self._conn.rollback()
-            raise StorageError(f"Failed to save to SQLite database: {e}") from e
+        self.save_many([(data, filename, metadata)])
+
+    def save_bytes(self, buf: bytes | memoryview | io.BytesIO, filename: str, metadata: PageMeta | None = None):
+        """Saves UTF-8 encoded HTML bytes to the database without decoding them."""
+        self.save_many([(buf, filename, metadata)])
 
-    def read(self, filename: str) -> io.StringIO:
+    def save_many(self, items: Iterable[SaveItem], batch_size: int | None = None):
+        """
+        Saves multiple pages in a single transaction.
+        1件ごとにcommit(=fsync)するのではなく、executemanyで全件を流し込んでから一度だけcommitする。
+        batch_size を指定すると、その件数ごとに別のトランザクションに分けてcommitする(巨大な入力でWALが膨らみすぎないように)。
+        """
+        rows = (
+            (_url_hash(url), url, metadata.category if metadata else '', *self._compress(buf))
+            for buf, url, metadata in items
+        )
+        batches = itertools.batched(rows, batch_size) if batch_size else [list(rows)]
+
+        for batch in batches:
+            if not batch:
+                continue
+            # 書き込み接続(と、それに紐づく self._save_cur)は、ロックを持っている間だけ使う
+            with self._write_lock:
+                conn = self._conn
+                try:
+                    logger.debug("Using SQLiteStorageStrategy to save %s URLs in one transaction.", len(batch))
+                    # 暗黙のBEGIN(DEFERRED)だと、最初の書き込みの時点で書き込みロックを取りに行き、他の接続と競合すると
+                    # その場で SQLITE_BUSY になりうる。BEGIN IMMEDIATE で最初に書き込みロックを確保してから流し込む。
+                    conn.execute("BEGIN IMMEDIATE")
+                    # 接続の with構文は、ブロックを抜けるときに成功ならcommit、例外ならrollbackする(sqlite3.Error以外の例外でも)
+                    with conn:
+                        self._save_cur.executemany(self._SAVE_SQL, batch)
+                except sqlite3.Error as e:
+                    raise StorageError(f"Failed to save to SQLite database: {e}") from e
+            self._url_set.update(url for _url_hash, url, _category, _content, _content_hash in batch)
+            logger.debug("Successfully saved/updated %s URLs in '%s'.", len(batch), self.db_path)
+
+    def read(self, filename: str) -> str:
         """Reads HTML content from the database using the URL as a key."""
         url = filename
-        sql = "SELECT content FROM scraped_pages WHERE reference_url = ?;"
         try:
-            print(f"SQLiteStorage: Reading '{url}'.")
-            cursor = self._conn.cursor()
-            cursor.execute(sql, (url,))
-            result = cursor.fetchone()
+            logger.debug("SQLiteStorage: Reading '%s'.", url)
+            # SQL文が実行途中のまま残ると、読み取りトランザクションが開きっぱなしになる(WALのチェックポイントを妨げる)。
+            # 最大1行なので fetchall() で最後まで読み切る。
+            result = self._read_conn().execute(self._READ_SQL, (_url_hash(url), url)).fetchall()
             if result:
-                return io.StringIO(result[0])
+                return self._decompress(*result[0])
             else:
                 raise StorageFileNotFoundError(f"URL not found in SQLite database: {url}")
         except sqlite3.Error as e:
             raise StorageError(f"Failed to read from SQLite database: {e}") from e
 
-    def exists(self, filename: str) -> bool:
-        """Checks if a record for the given URL exists in the database."""
+    def read_stream(self, filename: str) -> BinaryIO:
+        """Returns the stored HTML of a URL as an in-memory stream of UTF-8 bytes (decompressed, but never decoded to str)."""
         url = filename
-        sql = "SELECT 1 FROM scraped_pages WHERE reference_url = ?;"
         try:
-            cursor = self._conn.cursor()
-            cursor.execute(sql, (url,))
-            return cursor.fetchone() is not None
+            result = self._read_conn().execute(self._READ_SQL, (_url_hash(url), url)).fetchall()
         except sqlite3.Error as e:
-            print(f"An error occurred while checking existence in SQLite: {e}")
-            return False
+            raise StorageError(f"Failed to read from SQLite database: {e}") from e
+        if not result:
+            raise StorageFileNotFoundError(f"URL not found in SQLite database: {url}")
+        content, encoding = result[0]
+        if encoding == 'zstd':
+            return io.BytesIO(self._decompressor().decompressobj().decompress(content))
+        return io.BytesIO(content.encode('utf-8') if isinstance(content, str) else content)
+
+    def fetch_content(self, page_id: int) -> str:
+        """Reads the HTML content of one page by its id (as yielded by get_header_iterator)."""
+        try:
+            result = self._read_conn().execute(self._FETCH_CONTENT_SQL, (page_id,)).fetchall()
+        except sqlite3.Error as e:
+            raise StorageError(f"Failed to read from SQLite database: {e}") from e
+        if not result:
+            raise StorageFileNotFoundError(f"Page id {page_id} not found in SQLite database.")
+        return self._decompress(*result[0], errors='ignore')
+
+    def get_header_iterator(self) -> Iterator[tuple]:
+        """
+        Yields (id, category, reference_url, scraped_at) for all pages without reading their content.
+        HTML本体が必要なページだけ fetch_content(id) で取得する使い方を想定している。
+        """
+        if not self.db_path.exists():
+            raise StorageFileNotFoundError(f"Database file not found: {self.db_path}")
+
+        try:
+            cursor = self._read_conn().execute(self._STREAM_HEADERS_SQL)
+            cursor.arraysize = SQLITE_FETCH_ARRAYSIZE
+            while rows := cursor.fetchmany():
+                yield from rows
+        except sqlite3.Error as e:
+            raise StorageError(f"Failed to stream from SQLite database: {e}") from e
+
+    def exists(self, filename: str) -> bool:
+        """Checks if a record for the given URL exists, using the in-memory URL set."""
+        return filename in self._url_set
 
     def close(self):
-        """Closes the database connection."""
+        """Closes the database connections."""
         if self._conn:
-            self._conn.close()
-            self._conn = None
-            print(f"SQLite connection to '{self.db_path}' closed.")
+            with self._read_conns_lock:
+                for conn in self._read_conns:
+                    conn.close()
+                self._read_conns.clear()
+            # 保存中のトランザクションが終わるのを待ってから閉じる
+            with self._write_lock:
+                self._conn.close()
+                self._conn = None
+            logger.info("SQLite connection to '%s' closed.", self.db_path)
 
     # この関数が呼ばれると、rowを返すのではなく、この関数から作られるジェネレーターインスタンスがメモリ上に展開され、返される。
     def get_storage_iterator(self) -> Iterator[tuple]:
@@ -428,56 +1387,139 @@ class SQLiteStorageStrategy(StorageStrategy):
         if not self.db_path.exists():
             raise StorageFileNotFoundError(f"Database file not found: {self.db_path}")
 
-        conn = None
-        # ここで with構文は使えない。なぜなら、sqlite3でのwithは、トランザクションの管理を自動的に行ってくれるためのものなので。
+        # このスレッドの読み込み用接続を使う。
+        # ここで sqlite3 の接続自体の with構文は使えない。なぜなら、sqlite3でのwithは、トランザクションの管理を自動的に行ってくれるためのものなので。
+        yield from self._stream_pages(self._read_conn())
+
+    def get_storage_iterator_into(self, buf: list) -> Iterator[list]:
+        """
+        Streams all pages like get_storage_iterator(), reusing buf instead of building a tuple per row.
+        The consumer must copy what it needs before advancing the iterator.
+        """
+        if not self.db_path.exists():
+            raise StorageFileNotFoundError(f"Database file not found: {self.db_path}")
+
+        buf[:] = (None, None, None, None)
+        decompress = self._decompress
+        try:
+            cursor = self._read_conn().execute(self._STREAM_PAGES_SQL)
+            cursor.arraysize = SQLITE_FETCH_ARRAYSIZE
+            while rows := cursor.fetchmany():
+                for buf[0], buf[1], content, encoding, buf[3] in rows:
+                    buf[2] = decompress(content, encoding, errors='ignore')
+                    yield buf
+        except sqlite3.Error as e:
+            raise StorageError(f"Failed to stream from SQLite database: {e}") from e
+
+    def _stream_pages(self, conn: sqlite3.Connection) -> Iterator[tuple]:
         try:
-            conn = sqlite3.connect(self.db_path)
-            #  SQLiteのデータベース内では、TEXT 型のデータは特定のエンコーディング（通常はUTF-8）のバイト列として保存されています。
-            # スクレイピングで取得したHTMLデータには、さまざまな理由（文字化け、不正な文字コードの混入など）で、UTF-8として正しくデコードできないバイト列が含まれていることがよくあり
-            #conn.text_factory は、この「バイト列 → 文字列」の変換ルールをプログラマが自由にカスタマイズできる機能
-            # バイト列 b を（デフォルトのUTF-8で）デコードしなさい。
-            # ただし、もしデコードできない不正なバイトが見つかっても、エラーを発生させるのではなく、その不正なバイトを просто無視（ignore）して処理を続けてください。
-            conn.text_factory = lambda b: b.decode(errors='ignore')
+            # 以前は conn.text_factory = lambda b: b.decode(errors='ignore') で、TEXT列の値ごとにPythonの関数を呼んでいた。
+            # 今はHTML本体(content)はBLOBで保存され、展開時に不正なバイトを無視してデコードしている。
+            # 残りのTEXT列(category, reference_url, scraped_at)はPythonのstrから保存したもの(=正しいUTF-8)なので、
+            # デフォルトの(C実装の)デコードで問題なく、text_factoryのコールバックは不要。
             cursor = conn.cursor()
-            query = "SELECT category, reference_url, content, scraped_at FROM scraped_pages ORDER BY id"
 
-            print(f"SQLiteStorage: Streaming pages from '{self.db_path}'...")
-            cursor.execute(query)
+            logger.info("SQLiteStorage: Streaming pages from '%s'...", self.db_path)
+            cursor.execute(self._STREAM_PAGES_SQL)
 
-            for row in cursor:
-                yield row # (category, reference_url, content, scraped_at)
+            # 1行ずつではなく SQLITE_FETCH_ARRAYSIZE 行ずつまとめて取り出し、PythonとCの間の行き来を減らす
+            cursor.arraysize = SQLITE_FETCH_ARRAYSIZE
+            while rows := cursor.fetchmany():
+                for category, reference_url, content, encoding, scraped_at in rows:
+                    # HTML本体は不正なバイトが含まれていても処理を止めないよう、展開時に不正なバイトを無視してデコードする
+                    yield category, reference_url, self._decompress(content, encoding, errors='ignore'), scraped_at
 
         except sqlite3.Error as e:
             raise StorageError(f"Failed to stream from SQLite database: {e}") from e
-        finally:
-            if conn:
-                conn.close()
 
 
 # --- Factory Function ---
-def get_storage_strategy(env: str, interaction_dir: str, step_context: str = 'default') -> StorageStrategy:
+# プロジェクトのルートディレクトリ(このファイルがある場所)。ファクトリが呼ばれるたびに計算し直さないよう、モジュール読み込み時に一度だけ求める。
+_PROJECT_ROOT = pathlib.Path(__file__).resolve().parent
+
+
+@lru_cache(maxsize=None)
+def _resolve_local_path(interaction_dir: str) -> pathlib.Path:
+    """Returns the absolute output directory for interaction_dir (memoized; the result is deterministic)."""
+    return _PROJECT_ROOT / interaction_dir
+
+
+# 生成済みの戦略インスタンスのキャッシュ。同じ設定で何度呼ばれても、SQLiteの接続やスキーマ確認、
+# GCSクライアントの準備をやり直さずに同じインスタンスを返す。プロセス終了時には close_all() で閉じる。
+_strategy_cache: dict[tuple, StorageStrategy] = {}
+_strategy_cache_lock = threading.Lock()
+
+
+def get_storage_strategy(
+    env: str,
+    interaction_dir: str,
+    step_context: str = 'default',
+    sqlite_pragmas: dict | None = None,
+    gcs_default_cache_control: str | None = GCS_DEFAULT_CACHE_CONTROL,
+) -> StorageStrategy:
     """
     Factory function to select the appropriate storage strategy.
+    Instances are cached per argument combination; call close_all() on shutdown.
+    sqlite_pragmas は、SQLiteを使う場合にデフォルトのPRAGMA設定(SQLITE_PRAGMAS)を上書きする。
+    gcs_default_cache_control は、GCSに保存するオブジェクトに付ける Cache-Control(公開バケットでのみ効果がある)。
     """
+    cache_key = (
+        env, str(interaction_dir), step_context, frozenset((sqlite_pragmas or {}).items()), gcs_default_cache_control
+    )
+    with _strategy_cache_lock:
+        strategy = _strategy_cache.get(cache_key)
+        # 個別にclose()されたSQLiteの戦略は再利用できないので作り直す
+        if strategy is None or (isinstance(strategy, SQLiteStorageStrategy) and strategy._conn is None):
+            strategy = _create_storage_strategy(
+                env, interaction_dir, step_context, sqlite_pragmas, gcs_default_cache_control
+            )
+            _strategy_cache[cache_key] = strategy
+        return strategy
+
+
+def close_all() -> None:
+    """Closes every cached storage strategy and clears the cache."""
+    with _strategy_cache_lock:
+        strategies = list(_strategy_cache.values())
+        _strategy_cache.clear()
+    for strategy in strategies:
+        close = getattr(strategy, 'close', None)
+        if close is not None:
+            close()
+
+
+def _create_storage_strategy(
+    env: str,
+    interaction_dir: str,
+    step_context: str,
+    sqlite_pragmas: dict | None,
+    gcs_default_cache_control: str | None,
+) -> StorageStrategy:
+    """Builds a new storage strategy instance (uncached)."""
 
     if env == 'production':
         if step_context == 'step4': # step4ではページ保存用の戦略を返す
-            return GCSPageStorageStrategy(bucket_name=GCS_BUCKET_NAME, gcs_path_prefix=f'{interaction_dir}/pages')
+            return GCSPageStorageStrategy(
+                bucket_name=GCS_BUCKET_NAME,
+                gcs_path_prefix=f'{interaction_dir}/pages',
+                cache_control=gcs_default_cache_control,
+            )
         else: # それ以外のステップでは単純ファイル用の戦略を返す
-            return GCSFileStorageStrategy(bucket_name=GCS_BUCKET_NAME, gcs_path_prefix=interaction_dir)
+            return GCSFileStorageStrategy(
+                bucket_name=GCS_BUCKET_NAME, gcs_path_prefix=interaction_dir, cache_control=gcs_default_cache_control
+            )
 
 
     # --- 開発環境の場合の分岐 ---
     # ベースとなるディレクトリパスを最初に組み立てる
     # 例: 'outputs/20250924_103055_123456'
-    project_root_dir = pathlib.Path(__file__).parent
-    full_output_dir = project_root_dir / interaction_dir
+    full_output_dir = _resolve_local_path(interaction_dir)
 
     if step_context == 'step4':
         # SQLiteの場合、ファイル名を指定
         # 例: 'outputs/20250924_.../scraped_data.sqlite'
         db_path = full_output_dir / SQLITE_DB_FILENAME
-        return SQLiteStorageStrategy(db_path=db_path)
+        return SQLiteStorageStrategy(db_path=db_path, pragmas=sqlite_pragmas)
     else:
         # ローカルファイルストレージの場合、ディレクトリをそのまま渡す
         # 例: 'outputs/20250924_...'
@@ -1,24 +1,25 @@
 import io
 import csv
 
-def convert_rows_to_in_memory_csv(data_rows: list[list[str]]) -> io.StringIO:
+def convert_rows_to_in_memory_csv_bytes(data_rows: list[list[str]]) -> io.BytesIO:
     """
-    Takes a list of rows (where each row is a list of strings)
-    and converts it into an in-memory CSV file object.
+    Takes a list of rows and writes them as UTF-8 encoded CSV directly
+    into an in-memory bytes buffer.
 
     Args:
         data_rows: A list of lists, where each inner list represents a row.
 
     Returns:
-        An io.StringIO object containing the CSV data.
+        An io.BytesIO object containing the UTF-8 encoded CSV data.
     """
-    string_io = io.StringIO()
-    writer = csv.writer(string_io)
-
-    # writerowはリストを受け取るので、そのまま渡すだけ
+    bytes_io = io.BytesIO()
+    # csv.writer は文字列を書き込むので、BytesIOの上にTextIOWrapperを被せてその場でUTF-8にエンコードする。
+    # こうすると、保存時に StringIO → str → bytes と丸ごとコピーし直す必要がなくなる。
+    text_io = io.TextIOWrapper(bytes_io, encoding='utf-8', newline='', write_through=True)
+    writer = csv.writer(text_io)
     writer.writerows(data_rows)
 
-    # io.StringIO オブジェクトに書き込みを行うと、カーソル（現在の位置）が末尾に移動します。このバッファを後で
-    # storage_saver.save で読み込む際に、カーソルが末尾にあると何も読み込めません。
-    string_io.seek(0)
-    return string_io
\ No newline at end of file
+    # TextIOWrapperは破棄される時に下層のBytesIOもcloseしてしまうので、detach()で切り離しておく
+    text_io.detach()
+    bytes_io.seek(0)
+    return bytes_io